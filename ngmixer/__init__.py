@@ -5,6 +5,9 @@ from . import ngmixing
 from . import priors
 from . import util
 from . import defaults
+from . import timing
+from . import profiling
+from . import obsbuffers
 from . import bootfit
 from . import mofngmixing
 from . import megamixer
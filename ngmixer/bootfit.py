@@ -11,6 +11,8 @@ from .defaults import DEFVAL, NO_ATTEMPT, \
     LOW_PSF_FLUX, PSF_FLUX_FIT_FAILURE
 from .fitting import BaseFitter
 from .util import Namer, print_pars
+from .timing import TIMER
+from . import obsbuffers
 
 # ngmix imports
 import ngmix
@@ -91,8 +93,6 @@ class NGMixBootFitter(BaseFitter):
         return new_mb_obs_list
 
     def _add_extra_sim_noise(self, mb_obs_list):
-        from numpy.random import normal
-
         target_noise=self['target_noise']
         target_var = target_noise**2
         target_ivar = 1.0/target_var
@@ -102,13 +102,15 @@ class NGMixBootFitter(BaseFitter):
         for obslist in mb_obs_list:
             for obs in obslist:
 
-                obs.image_orig=obs.image.copy()
-                obs.weight_orig=obs.weight.copy()
-
                 wt=obs.weight
                 w=numpy.where(wt > 0)
                 if w[0].size > 0:
 
+                    # the noisy image and weight are new arrays, so the
+                    # originals can be kept without copying them
+                    obs.image_orig=obsbuffers.share(obs.image)
+                    obs.weight_orig=obsbuffers.share(obs.weight)
+
                     im = obs.image
 
                     extra_var_values = numpy.zeros(im.shape)
@@ -124,21 +126,30 @@ class NGMixBootFitter(BaseFitter):
                     extra_var_values[w] = target_var - orig_var[w]
                     extra_noise_values = numpy.sqrt(extra_var_values)
 
-                    noise_image = normal(loc=0.0, scale=1.0, size=im.shape)
+                    noise_image = self.rng.normal(loc=0.0, scale=1.0, size=im.shape)
                     noise_image *= extra_noise_values
-                    im += noise_image
+                    im = im + noise_image
                 
+                    wt = wt.copy()
                     wt[w] = target_ivar
 
                     obs.image = im
                     obs.weight = wt
+                else:
+                    # the image and weight are kept, so sharing them would
+                    # leave them read-only
+                    obs.image_orig=obs.image.copy()
+                    obs.weight_orig=obs.weight.copy()
 
-
-    def __call__(self,mb_obs_list,coadd=False,make_epoch_data=True,nbrs_fit_data=None):
+    def __call__(self,mb_obs_list,coadd=False,make_epoch_data=True,nbrs_fit_data=None,rng=None):
         """
         fit the obs list
         """
 
+        if rng is None:
+            rng = numpy.random
+        self.rng = rng
+
         if 'target_noise' in self:
             self._add_extra_sim_noise(mb_obs_list)
 
@@ -303,6 +314,7 @@ class NGMixBootFitter(BaseFitter):
             raise ValueError("no support for unmodeled nbrs "
                              "masking type %s" % mtype)
 
+    @TIMER.timed('nbrs')
     def _render_nbrs(self,model,mb_obs_list,coadd,nbrs_fit_data):
         """
         render nbrs
@@ -641,8 +653,10 @@ class NGMixBootFitter(BaseFitter):
             n = Namer('psf')
 
         try:
-            self._fit_psfs(coadd)
-            flags |= self._fit_psf_flux(coadd)
+            with TIMER('psf'):
+                self._fit_psfs(coadd)
+            with TIMER('psf_flux'):
+                flags |= self._fit_psf_flux(coadd)
 
             if flags == 0:
                 dindex = 0
@@ -653,7 +667,8 @@ class NGMixBootFitter(BaseFitter):
 
             if flags == 0:
                 try:
-                    self._fit_galaxy(model,coadd,guess=guess,**kwargs)
+                    with TIMER('gal'):
+                        self._fit_galaxy(model,coadd,guess=guess,**kwargs)
                     self._copy_galaxy_result(model,coadd)
                     self._print_galaxy_result()
                 except (BootGalFailure,GMixRangeError) as err:
@@ -1338,6 +1353,7 @@ class MetacalNGMixBootFitter(MaxNGMixBootFitter):
         res=self.gal_fitter.get_result()
         res.update(metacal_res)
 
+    @TIMER.timed('metacal')
     def _do_metacal(self,
                     model,
                     boot,
@@ -1516,9 +1532,9 @@ class MetacalDetrendNGMixFitter(MetacalNGMixBootFitter):
         im=obs.image
         wt=obs.weight
 
-        noise_image1 = numpy.random.normal(loc=0.0,
-                                           scale=1.0,
-                                           size=im.shape)
+        noise_image1 = self.rng.normal(loc=0.0,
+                                       scale=1.0,
+                                       size=im.shape)
         w=numpy.where(wt > 0)
         base_noise = numpy.sqrt( numpy.median(1.0/wt[w]) )
 
@@ -52,7 +52,8 @@ BIG_PDEFVAL = 9.999e9
 
 ################################
 # running code
-_CHECKPOINTS_DEFAULT_MINUTES = [0,30,60,110]
+# checkpoint this often if no checkpoint policy is set in the config
+_CHECKPOINT_DEFAULT_SECONDS = 1800
 
 ################################
 # setup logging/verbosity
@@ -77,7 +77,7 @@ class BaseFitter(dict):
         """
         raise NotImplementedError("get_default_epoch_fit_data method of BaseFitter must be defined in subclass.")
 
-    def __call__(self,mb_obs_list,coadd=False,make_epoch_data=True,nbrs_fit_data=None,make_plots=False):
+    def __call__(self,mb_obs_list,coadd=False,make_epoch_data=True,nbrs_fit_data=None,make_plots=False,rng=None):
         """
         do fit of single obs list
 
@@ -104,6 +104,10 @@ class BaseFitter(dict):
 
         If make_plots is set, fitter should make some plots.
 
+        If rng is not None, it is a numpy.random.RandomState for the FoF being fit. The fitter should
+        draw any random numbers it needs from it, so that the results of a FoF do not depend on which
+        other FoFs were fit before it.
+
         Nbrs Modeling
         -------------
         if nbrs_fit_data is not None, then all of the nbrs for this obejct should be modeled.
@@ -2,6 +2,16 @@ import imageio
 import medsio
 import simpsimmedsio
 import desmedsio
+import prefetch
+import bulkmeds
+import medscache
+import extradata
+import psfexstore
+import psfcache
+import maskengine
+import cutoutcache
+import wcsstore
+import manifest
 
 from .imageio import ImageIO
 from .medsio import MEDSImageIO
@@ -0,0 +1,112 @@
+"""
+MEDS reader that gets all cutouts of an object in one read
+"""
+from __future__ import print_function
+from collections import OrderedDict
+import numpy
+import meds
+
+def get_cutout_view(m, iobj, icutout, type='image'):
+    """
+    get a cutout for reading only
+
+    For a BulkMEDS this is a read-only view of the cached planes, for other
+    MEDS readers a new cutout.  Copy a read-only cutout before writing to
+    it.
+    """
+    if isinstance(m, BulkMEDS):
+        return m.get_cutout_views(iobj, type=type)[icutout]
+    return m.get_cutout(iobj, icutout, type=type)
+
+class BulkMEDS(meds.MEDS):
+    """
+    MEDS file where get_cutout reads all cutouts of an object for a given
+    type (image, weight, seg, bmask, ...) with a single read
+
+    The cutouts of an object are stored next to each other in each
+    cutout HDU, so the whole object is one read of ncutout*box_size**2
+    pixels.  The planes of the last few objects are kept in a small cache,
+    so the calls to get_cutout for each icut, and those made internally by
+    get_cweight_cutout_nearest and interpolate_coadd_seg, read the file
+    only once per object and type.
+
+    get_cutout returns a copy, as for meds.MEDS, since the methods of
+    meds.MEDS modify the cutouts they get in place.  get_cutout_views
+    returns read-only views, see also get_cutout_view.  Call clear_cache
+    when done with a group of objects.
+
+    parameters
+    ----------
+    filename: string
+        the MEDS file
+    cache_size: int, optional
+        number of (object,type) planes to keep, default 8
+    """
+    def __init__(self, filename, cache_size=8, **kw):
+        super(BulkMEDS,self).__init__(filename, **kw)
+        self._plane_cache_size = cache_size
+        self._plane_cache = OrderedDict()
+
+    def get_cutout(self, iobj, icutout, type='image'):
+        if type == 'psf':
+            return super(BulkMEDS,self).get_cutout(iobj, icutout, type=type)
+
+        return self.get_cutout_views(iobj, type=type)[icutout].copy()
+
+    def get_cutout_views(self, iobj, type='image'):
+        """
+        get read-only views of all cutouts of an object
+
+        returns
+        -------
+        cutouts: array of shape (ncutout, box_size, box_size)
+        """
+        key = (iobj,type)
+        if key in self._plane_cache:
+            planes = self._plane_cache.pop(key)
+        else:
+            planes = self._read_planes(iobj, type)
+            while len(self._plane_cache) >= self._plane_cache_size:
+                self._plane_cache.popitem(last=False)
+
+        # most recently used goes at the end
+        self._plane_cache[key] = planes
+        return planes
+
+    def _read_planes(self, iobj, type):
+        """
+        read all cutouts of an object at once
+        """
+        self._check_indices(iobj)
+
+        ncutout = self['ncutout'][iobj]
+        box_size = self['box_size'][iobj]
+        npix = box_size*box_size
+        start_rows = self['start_row'][iobj,0:ncutout]
+
+        if ncutout == 0:
+            planes = numpy.zeros((0,box_size,box_size))
+        elif numpy.all(numpy.diff(start_rows) == npix):
+            extname = '%s_cutouts' % type
+            flat = self._read_flat(extname, start_rows[0], ncutout*npix)
+            planes = flat.reshape(ncutout, box_size, box_size)
+        else:
+            # not stored contiguously, read one at a time
+            planes = [super(BulkMEDS,self).get_cutout(iobj, icut, type=type)
+                      for icut in xrange(ncutout)]
+            planes = numpy.array(planes)
+
+        planes.flags.writeable = False
+        return planes
+
+    def _read_flat(self, extname, start, npix):
+        """
+        read npix pixels of a cutout HDU starting at start
+        """
+        return self._fits[extname][start:start+npix]
+
+    def clear_cache(self):
+        """
+        forget all cached planes
+        """
+        self._plane_cache.clear()
@@ -0,0 +1,53 @@
+"""
+cache of the mask cutouts of the objects of a FoF
+"""
+from __future__ import print_function
+from .. import obsbuffers
+from .bulkmeds import get_cutout_view
+
+class CutoutCache(object):
+    """
+    bmask and seg cutouts read once per FoF and shared by everything that
+    uses them
+
+    The cutouts are read-only, see obsbuffers.  Clear the cache when the FoF
+    is done; the cutouts held by observations stay valid.
+
+        seg = cache.get(meds, mindex, icut, 'coadd_seg')
+
+    types
+    -----
+    'bmask', 'seg': the cutouts in the MEDS file
+    'coadd_seg': the coadd seg map interpolated to the cutout, or the seg
+        cutout if that fails
+    """
+    def __init__(self):
+        self.nhit = 0
+        self.nmiss = 0
+        self._cutouts = {}
+
+    def __len__(self):
+        return len(self._cutouts)
+
+    def get(self, meds, mindex, icut, type):
+        key = (id(meds),mindex,icut,type)
+        if key in self._cutouts:
+            self.nhit += 1
+        else:
+            self.nmiss += 1
+            self._cutouts[key] = obsbuffers.share(self._read(meds, mindex, icut, type))
+        return self._cutouts[key]
+
+    def _read(self, meds, mindex, icut, type):
+        if type == 'coadd_seg':
+            try:
+                return meds.interpolate_coadd_seg(mindex, icut)
+            except:
+                return get_cutout_view(meds, mindex, icut, type='seg')
+        elif type in ['bmask','seg']:
+            return get_cutout_view(meds, mindex, icut, type=type)
+        else:
+            raise ValueError("no cached cutouts of type %s" % type)
+
+    def clear(self):
+        self._cutouts.clear()
@@ -6,12 +6,15 @@ import copy
 import fitsio
 
 from .medsio import MEDSImageIO
+from .psfcache import PSFImageCache
+from .manifest import pack_headers, unpack_headers
+from .wcsstore import WCSStore, get_wcs_store
+from .psfexstore import PSFExStore, get_psfex_status, PSFEX_MISSING, PSFEX_INVALID
+from .maskengine import MaskEngine, get_satstar_mask, expand_mask
 from .. import nbrsfofs
+from .. import obsbuffers
 from ..util import print_with_verbosity, \
-    interpolate_image, \
-    radec_to_unitvecs_ruv, \
-    radec_to_thetaphi, \
-    thetaphi_to_unitvecs_ruv
+    get_tangent_plane_offsets
 
 import meds
 
@@ -104,12 +107,10 @@ class SVDESMEDSImageIO(MEDSImageIO):
                 if obs.meta['flags'] == 0:
                     pixel_scale2 = obs.jacobian.get_det()
                     pixel_scale4 = pixel_scale2*pixel_scale2
-                    obs.image /= pixel_scale2
-                    obs.weight *= pixel_scale4
-                    if obs.weight_raw is not None:
-                        obs.weight_raw *= pixel_scale4
-                    if obs.weight_us is not None:
-                        obs.weight_us *= pixel_scale4
+                    obsbuffers.update_pixels(obs,['image'],
+                                             lambda arr: numpy.divide(arr,pixel_scale2,arr))
+                    obsbuffers.update_pixels(obs,['weight','weight_raw','weight_us'],
+                                             lambda arr: numpy.multiply(arr,pixel_scale4,arr))
 
         return coadd_obs_list, obs_list
 
@@ -128,9 +129,43 @@ class SVDESMEDSImageIO(MEDSImageIO):
         image_id = meds._image_info[file_id]['image_id']
         obs.meta['meta_data']['image_id'][0]  = image_id
 
+    def _set_defaults(self):
+        super(SVDESMEDSImageIO,self)._set_defaults()
+
+        # max number of psfex objects to keep loaded per band
+        self.conf['psfex_max_models'] = self.conf.get('psfex_max_models',100)
+
+        # reuse psf images for cutouts of an image at about the same
+        # position, rounded to psf_cache_tol pixels; psf_cache_tol > 0 is
+        # lossy, the psfs are made at the rounded positions, but with 0 the
+        # psfs are almost never reused and the cache does not pay off
+        self.conf['psf_cache'] = self.conf.get('psf_cache',False)
+        self.conf['psf_cache_tol'] = self.conf.get('psf_cache_tol',0.0)
+        self.conf['psf_cache_max_mb'] = self.conf.get('psf_cache_max_mb',100)
+
     def _load_psf_data(self):
         self.psfex_lists = self._get_psfex_lists()
 
+        if self.conf['psf_cache']:
+            max_bytes = int(self.conf['psf_cache_max_mb']*1024**2)
+            self.psf_cache = PSFImageCache(tol=self.conf['psf_cache_tol'],max_bytes=max_bytes)
+            if self.conf['psf_cache_tol'] > 0:
+                print("warning: psf_cache_tol = %g, psfs are made at positions "
+                      "rounded to %g pixels" % (self.conf['psf_cache_tol'],self.conf['psf_cache_tol']))
+        else:
+            self.psf_cache = None
+
+    def print_cache_stats(self):
+        """
+        print the hits and misses of the cutout and psf caches
+        """
+        super(SVDESMEDSImageIO,self).print_cache_stats()
+        if self.psf_cache is not None:
+            print_with_verbosity('psf cache: %d hits, %d misses, %d made ahead' % (self.psf_cache.nhit,
+                                                                                  self.psf_cache.nmiss,
+                                                                                  self.psf_cache.nfill),
+                                 verbosity=1)
+
     def _get_psf_image(self, band, mindex, icut):
         """
         Get an image representing the psf
@@ -139,17 +174,95 @@ class SVDESMEDSImageIO(MEDSImageIO):
         meds=self.meds_list[band]
         file_id=meds['file_id'][mindex,icut]
 
-        pex=self.psfex_lists[band][file_id]
-
         row=meds['orig_row'][mindex,icut]
         col=meds['orig_col'][mindex,icut]
 
+        if self.psf_cache is None:
+            return self._make_psf_image(band, file_id, row, col)
+
+        key,row,col = self.psf_cache.get_key(band, file_id, row, col)
+        entry = self.psf_cache.get(key)
+        if entry is None:
+            entry = self._make_psf_image(band, file_id, row, col)
+            self._cache_psf_image(key, entry)
+
+        return entry
+
+    def _make_psf_image(self, band, file_id, row, col, pex=None):
+        if pex is None:
+            pex=self.psfex_lists[band][file_id]
+
         im=pex.get_rec(row,col).astype('f8', copy=False)
         cen=pex.get_center(row,col)
         sigma_pix=pex.get_sigma()
 
         return im, cen, sigma_pix, pex['filename']
 
+    def _cache_psf_image(self, key, entry, pin=False, fill=False):
+        # the image is shared by all cutouts that use it
+        obsbuffers.share(entry[0])
+        self.psf_cache.put(key, entry, entry[0].nbytes, pin=pin, fill=fill)
+
+    def _start_fof(self, mindexes):
+        """
+        make the psfs for all cutouts of the FoF at once, making each
+        distinct one only once
+
+        The positions are grouped by image, so each psfex model is looked up
+        once per FoF.  The psfs of the FoF are pinned in the cache until the
+        next FoF, so they are not evicted before they are used.
+        """
+        if self.psf_cache is None:
+            return
+
+        self.psf_cache.unpin_all()
+
+        for band in self.iband:
+            meds=self.meds_list[band]
+            ncutout=meds['ncutout'][mindexes]
+            if ncutout.sum() == 0:
+                continue
+
+            ncut_max=ncutout.max()
+            use=numpy.arange(ncut_max)[numpy.newaxis,:] < ncutout[:,numpy.newaxis]
+
+            file_ids=meds['file_id'][mindexes,0:ncut_max][use]
+            rows,cols=self.psf_cache.quantize(meds['orig_row'][mindexes,0:ncut_max][use],
+                                              meds['orig_col'][mindexes,0:ncut_max][use])
+
+            # skip flagged images, they are never read
+            image_flags=self.all_image_flags[band][file_ids]
+            w,=numpy.where(image_flags == 0)
+            if w.size == 0:
+                continue
+
+            pos=numpy.zeros(w.size,dtype=[('file_id','i8'),('row','f8'),('col','f8')])
+            pos['file_id']=file_ids[w]
+            pos['row']=rows[w]
+            pos['col']=cols[w]
+
+            # sorted by file_id
+            pos=numpy.unique(pos)
+            bounds=numpy.flatnonzero(numpy.diff(pos['file_id'])) + 1
+            for ipos in numpy.split(pos,bounds):
+                self._make_psf_images(band, ipos['file_id'][0], ipos['row'], ipos['col'])
+
+    def _make_psf_images(self, band, file_id, rows, cols):
+        """
+        make and pin the psfs of an image at the sent positions, those
+        already in the cache are only pinned
+        """
+        pex=None
+        for row,col in zip(rows,cols):
+            key,row,col = self.psf_cache.get_key(band, file_id, row, col)
+            if key in self.psf_cache:
+                self.psf_cache.pin(key)
+            else:
+                if pex is None:
+                    pex=self.psfex_lists[band][file_id]
+                entry=self._make_psf_image(band, file_id, row, col, pex=pex)
+                self._cache_psf_image(key, entry, pin=True, fill=True)
+
     def _get_psfex_lists(self):
         """
         Load psfex objects for each of the SE images
@@ -189,38 +302,79 @@ class SVDESMEDSImageIO(MEDSImageIO):
 
     def _get_psfex_objects(self, meds, band):
         """
-        Load psfex objects for all images, including coadd
-        """
-        from psfex import PSFExError, PSFEx
+        Get a PSFExStore for all images, including coadd
 
-        psfex_list=[]
+        The psfex objects are loaded when first used.  If tile_cache_dir is
+        set, the check of which psfex files are there and valid is saved
+        there and shared by all jobs for the tile.
+        """
+        extname = 'image_info_%d' % band
+        if self.manifest is not None and extname in self.manifest:
+            # the image flags from the manifest include the psfex checks
+            psfpaths = [os.path.expandvars(psfpath.strip())
+                        for psfpath in self.manifest[extname]['psfpath']]
+            status = self.manifest[extname]['psfex_status']
+            return PSFExStore(psfpaths, status, max_models=self.conf['psfex_max_models'])
 
         info=meds.get_image_info()
         nimage=info.size
+
+        psfpaths=[]
+        for i in xrange(nimage):
+            impath=info['image_path'][i].strip()
+            psfpaths.append(self._psfex_path_from_image_path(meds, impath))
+
+        # don't even bother if we are going to skip this image
+        check = (self.all_image_flags[band] & self.conf['image_flags2check']) == 0
+
+        status = get_psfex_status(psfpaths, check,
+                                  status_file=self._get_psfex_status_file(band))
+
         for i in xrange(nimage):
-            pex=None
+            if status[i] == PSFEX_MISSING:
+                print("warning: missing psfex: %s" % psfpaths[i])
+                self.all_image_flags[band][i] |= self.conf['image_flags2check']
+            elif status[i] == PSFEX_INVALID:
+                print("warning: bad psfex: %s" % psfpaths[i])
+                self.all_image_flags[band][i] |= self.conf['image_flags2check']
 
-            # don't even bother if we are going to skip this image
-            flags = self.all_image_flags[band][i]
-            if (flags & self.conf['image_flags2check']) == 0:
+        return PSFExStore(psfpaths, status, max_models=self.conf['psfex_max_models'])
 
-                impath=info['image_path'][i].strip()
-                psfpath = self._psfex_path_from_image_path(meds, impath)
+    def get_manifest(self):
+        """
+        add the reduced image flags and the psfex files and their status
+        """
+        manifest = super(SVDESMEDSImageIO,self).get_manifest()
 
-                if not os.path.exists(psfpath):
-                    print("warning: missing psfex: %s" % psfpath)
-                    self.all_image_flags[band][i] |= self.conf['image_flags2check']
-                else:
-                    print_with_verbosity("loading: %s" % psfpath,verbosity=2)
-                    try:
-                        pex=PSFEx(psfpath)
-                    except PSFExError as err:
-                        print("problem with psfex file: %s " % str(err))
-                        pex=None
+        desdata=os.environ['DESDATA']
+        for band in self.iband:
+            pstore = self.psfex_lists[band]
+            psfpaths = [psfpath.replace(desdata,'${DESDATA}') for psfpath in pstore.psfpaths]
+            slen = max([len(psfpath) for psfpath in psfpaths] + [1])
 
-            psfex_list.append(pex)
+            info = numpy.zeros(len(psfpaths),dtype=[('image_flags','i8'),
+                                                    ('psfpath','S%d' % slen),
+                                                    ('psfex_status','i2')])
+            info['image_flags'] = self.all_image_flags[band]
+            info['psfpath'] = psfpaths
+            info['psfex_status'] = pstore.status
+            manifest['image_info_%d' % band] = info
 
-        return psfex_list
+        return manifest
+
+    def _get_psfex_status_file(self, band):
+        """
+        file with the status of the psfex files for a band, in tile_cache_dir
+        """
+        if self.conf['tile_cache_dir'] is None:
+            return None
+
+        bname = os.path.basename(self.meds_files_full[band])
+        bname = bname.replace('.fits.fz','').replace('.fits','')
+        if self.conf['use_psf_rerun']:
+            bname = '%s-%s' % (bname,self.conf['psf_rerun_version'])
+        fname = os.path.join(self.conf['tile_cache_dir'],'%s-psfex-status.fits' % bname)
+        return os.path.expandvars(fname)
 
     def _get_replacement_flags(self, filenames):
         from .util import CombinedImageFlags
@@ -247,7 +401,7 @@ class SVDESMEDSImageIO(MEDSImageIO):
         for i,funexp in enumerate(self.meds_files):
             f = os.path.expandvars(funexp)
             print('band %d meds: %s' % (i,f))
-            medsi=meds.MEDS(f)
+            medsi=self._open_meds(f)
             medsi_meta=medsi.get_meta()
             image_info=medsi.get_image_info()
 
@@ -260,6 +414,15 @@ class SVDESMEDSImageIO(MEDSImageIO):
                                      "sizes: %d/%d" % (nobj_tot,nobj))
             self.meds_list.append(medsi)
             self.meds_meta_list.append(medsi_meta)
+
+            # already reduced, including the psfex checks
+            extname = 'image_info_%d' % i
+            if self.manifest is not None and extname in self.manifest:
+                image_flags = self.manifest[extname]['image_flags'].astype('i8')
+                assert image_flags.size == image_info.size,"tile manifest images do not match MEDS file %s!" % f
+                self.all_image_flags.append(image_flags)
+                continue
+
             image_flags=image_info['image_flags'].astype('i8')
 
             if 'replacement_flags' in self.conf and self.conf['replacement_flags'] is not None and image_flags.size > 1:
@@ -319,6 +482,7 @@ class MOFSVDESMEDSImageIO(SVDESMEDSImageIO):
 class Y1DESMEDSImageIO(SVDESMEDSImageIO):
     def __init__(self,*args,**kwargs):
         super(Y1DESMEDSImageIO,self).__init__(*args,**kwargs)
+        self.mask_engine = MaskEngine()
         read_wcs = self.conf.get('read_wcs',False)
         if read_wcs:
             self._load_wcs_data()
@@ -331,52 +495,147 @@ class Y1DESMEDSImageIO(SVDESMEDSImageIO):
         
     def _load_wcs_data(self):
         """
-        Load the WCS transforms for each meds file
+        Set up the WCS transforms for each meds file, which are made when
+        first used
         """
-        from esutil.wcsutil import WCS
-
         print('loading WCS')
         wcs_transforms = {}
         for band in self.iband:
-            wcs_transforms[band] = {}
+            extname = 'wcs_%d' % band
+            if self.manifest is not None and extname in self.manifest:
+                headers = unpack_headers(self.manifest[extname])
+                wcs_transforms[band] = WCSStore(headers=headers)
+            else:
+                wcs_transforms[band] = get_wcs_store(self._get_wcs_paths(band),
+                                                     cache_file=self._get_wcs_cache_file(band))
 
-            info = self.meds_list[band].get_image_info()
-            nimage = info.size
-            meta = self.meds_meta_list[band]
+        self.wcs_transforms = wcs_transforms
+        self._load_sky_positions()
 
-            # get coadd file ID            
-            # a total hack, but should work!
-            # assumes all objects from the same coadd!
-            coadd_file_id = numpy.max(numpy.unique(self.meds_list[band]['file_id'][:,0]))
-            assert coadd_file_id >= 0,"Could not get coadd_file_id from MEDS file!"
-            
-            # in image header for coadd
-            coadd_path = info['image_path'][coadd_file_id].strip()
-            coadd_path = coadd_path.replace(meta['DESDATA'][0],'${DESDATA}')
+    def _load_sky_positions(self):
+        """
+        get the ra,dec of all objects in each band from the coadd WCS, with one
+        image2sky call per coadd
 
-            if os.path.exists(os.path.expandvars(coadd_path)):
-                h = fitsio.read_header(os.path.expandvars(coadd_path),ext=1)
-                wcs_transforms[band][coadd_file_id] = WCS(h)
-            else:
-                wcs_transforms[band][coadd_file_id] = None
-                print("warning: missing coadd WCS from image: %s" % coadd_path)
-
-            # in scamp head files for SE
-            if self.conf['read_me_wcs']:
-                scamp_dir = os.path.join('/'.join(coadd_path.split('/')[:-2]),'QA/coadd_astrorefine_head')
-                for i in xrange(nimage):
-                    if i != coadd_file_id:
-                        scamp_name = os.path.basename(info['image_path'][i].strip()).replace('.fits.fz','.head')
-                        scamp_file = os.path.join(scamp_dir,scamp_name)
-
-                        if os.path.exists(os.path.expandvars(scamp_file)):
-                            h = fitsio.read_scamp_head(os.path.expandvars(scamp_file))
-                            wcs_transforms[band][i] = WCS(h)
-                        else:
-                            wcs_transforms[band][i] = None
-                            print("warning: missing scamp head: %s" % scamp_file)
+        Objects without a coadd WCS get nan.
+        """
+        self.sky_ra = {}
+        self.sky_dec = {}
+        for band in self.iband:
+            meds = self.meds_list[band]
+            ra = numpy.zeros(meds.size) + numpy.nan
+            dec = numpy.zeros(meds.size) + numpy.nan
 
-        self.wcs_transforms = wcs_transforms
+            file_ids = meds['file_id'][:,0]
+            for file_id in numpy.unique(file_ids):
+                if file_id not in self.wcs_transforms[band]:
+                    continue
+
+                coadd_wcs = self.wcs_transforms[band][file_id]
+                if coadd_wcs is None:
+                    continue
+
+                w, = numpy.where(file_ids == file_id)
+                row = meds['orig_row'][w,0]
+                col = meds['orig_col'][w,0]
+                ra[w],dec[w] = coadd_wcs.image2sky(col+1.0,row+1.0) # reversed for esutil WCS objects!
+
+            self.sky_ra[band] = ra
+            self.sky_dec[band] = dec
+
+    def _set_nbrs_sky_offsets(self, mindexes):
+        """
+        get the u,v offsets of the nbrs of each object in the FoF from the
+        object, for all pairs at once
+        """
+        self.nbrs_sky_offsets = {}
+        if len(mindexes) <= 1:
+            return
+
+        numbers = self.meds_list[0]['number'][mindexes]
+        number2mindex = dict(zip(numbers,mindexes))
+
+        cens = []
+        nbrs = []
+        for mindex,number in zip(mindexes,numbers):
+            for nbr_number in self.nbrs_index.get_nbrs(number):
+                if nbr_number in number2mindex:
+                    cens.append(mindex)
+                    nbrs.append(number2mindex[nbr_number])
+
+        if len(cens) == 0:
+            return
+
+        cens = numpy.array(cens)
+        nbrs = numpy.array(nbrs)
+        for band in self.iband:
+            u,v = get_tangent_plane_offsets(self.sky_ra[band][cens],
+                                            self.sky_dec[band][cens],
+                                            self.sky_ra[band][nbrs],
+                                            self.sky_dec[band][nbrs])
+            for i in xrange(len(cens)):
+                self.nbrs_sky_offsets[band,cens[i],nbrs[i]] = numpy.array([u[i],v[i]])
+
+    def _add_nbrs_info(self,coadd_mb_obs_lists,me_mb_obs_lists,mindexes):
+        if hasattr(self,'sky_ra'):
+            self._set_nbrs_sky_offsets(mindexes)
+        super(Y1DESMEDSImageIO,self)._add_nbrs_info(coadd_mb_obs_lists,me_mb_obs_lists,mindexes)
+
+    def _get_wcs_paths(self, band):
+        """
+        the files with the WCS of each image, as file_id -> (path,kind), see
+        WCSStore
+        """
+        info = self.meds_list[band].get_image_info()
+        nimage = info.size
+        meta = self.meds_meta_list[band]
+
+        # get coadd file ID
+        # a total hack, but should work!
+        # assumes all objects from the same coadd!
+        coadd_file_id = numpy.max(numpy.unique(self.meds_list[band]['file_id'][:,0]))
+        assert coadd_file_id >= 0,"Could not get coadd_file_id from MEDS file!"
+
+        # in image header for coadd
+        coadd_path = info['image_path'][coadd_file_id].strip()
+        coadd_path = coadd_path.replace(meta['DESDATA'][0],'${DESDATA}')
+
+        paths = {}
+        paths[int(coadd_file_id)] = (coadd_path,'image')
+
+        # in scamp head files for SE
+        if self.conf['read_me_wcs']:
+            scamp_dir = os.path.join('/'.join(coadd_path.split('/')[:-2]),'QA/coadd_astrorefine_head')
+            for i in xrange(nimage):
+                if i != coadd_file_id:
+                    scamp_name = os.path.basename(info['image_path'][i].strip()).replace('.fits.fz','.head')
+                    paths[i] = (os.path.join(scamp_dir,scamp_name),'scamp')
+
+        return paths
+
+    def _get_wcs_cache_file(self, band):
+        """
+        file with the WCS headers for a band, in tile_cache_dir
+        """
+        if self.conf['tile_cache_dir'] is None:
+            return None
+
+        bname = os.path.basename(self.meds_files_full[band])
+        bname = bname.replace('.fits.fz','').replace('.fits','')
+        if self.conf['read_me_wcs']:
+            bname = '%s-me' % bname
+        fname = os.path.join(self.conf['tile_cache_dir'],'%s-wcs.fits' % bname)
+        return os.path.expandvars(fname)
+
+    def get_manifest(self):
+        """
+        add the WCS headers
+        """
+        manifest = super(Y1DESMEDSImageIO,self).get_manifest()
+        if hasattr(self,'wcs_transforms'):
+            for band in self.iband:
+                manifest['wcs_%d' % band] = pack_headers(self.wcs_transforms[band].get_headers())
+        return manifest
 
     def _get_offchip_nbr_psf_obs_and_jac(self,band,cen_ind,cen_mindex,cen_obs,nbr_ind,nbr_mindex,nbrs_obs_list):
         """
@@ -407,34 +666,13 @@ class Y1DESMEDSImageIO(SVDESMEDSImageIO):
         if self.meds_list[band]['ncutout'][nbr_mindex] == 0:
             return None,None
 
-        # 1) use coadd WCS to get offset in u,v
-        # 1a) first get coadd WCS
+        # 1) use coadd WCS to get offset in u,v, see _set_nbrs_sky_offsets
         assert self.meds_list[band]['file_id'][cen_mindex,0] == \
           self.meds_list[band]['file_id'][nbr_mindex,0], \
           "central and nbr have different coadd file IDs when getting off-chip WCS! cen file_id = %d, nbr file_id = %d"\
           % (self.meds_list[band]['file_id'][cen_mindex,0],self.meds_list[band]['file_id'][nbr_mindex,0])
-        coadd_wcs = self.wcs_transforms[band][self.meds_list[band]['file_id'][cen_mindex,0]]
-
-        # 1b) now get positions
-        row_cen = self.meds_list[band]['orig_row'][cen_mindex,0]
-        col_cen = self.meds_list[band]['orig_col'][cen_mindex,0]
-        ra_cen,dec_cen = coadd_wcs.image2sky(col_cen+1.0,row_cen+1.0) # reversed for esutil WCS objects!
-
-        row_nbr = self.meds_list[band]['orig_row'][nbr_mindex,0]
-        col_nbr = self.meds_list[band]['orig_col'][nbr_mindex,0]
-        ra_nbr,dec_nbr = coadd_wcs.image2sky(col_nbr+1.0,row_nbr+1.0) # reversed for esutil WCS objects!
-
-        # 1c) now get u,v offset
-        # FIXME - discuss projection with Mike and Erin
-        # right now using vector to point where rhat of nbr hits the tangent plane of the central
-        # differs in length from unity by 1/cos(angle between central and nbr)
-        # this is also a *tiny* effect!
-        rhat_cen,uhat_cen,vhat_cen = radec_to_unitvecs_ruv(ra_cen,dec_cen)
-        rhat_nbr,uhat_nbr,vhat_nbr = radec_to_unitvecs_ruv(ra_nbr,dec_nbr)
-        cosang = numpy.dot(rhat_cen,rhat_nbr)
-        u_nbr = numpy.dot(rhat_nbr,uhat_cen)/cosang/numpy.pi*180.0*60.0*60.0 # arcsec
-        v_nbr = numpy.dot(rhat_nbr,vhat_cen)/cosang/numpy.pi*180.0*60.0*60.0 # arcsec
-        uv_nbr = numpy.array([u_nbr,v_nbr])
+        uv_nbr = self.nbrs_sky_offsets[band,cen_mindex,nbr_mindex]
+        assert numpy.all(numpy.isfinite(uv_nbr)),"no coadd WCS for off-chip nbr %d of cen %d!" % (nbr_ind+1,cen_ind+1)
 
         # 2) use the Jacobian of the central to turn offset in u,v to row,col
         # Jacobian is used like this
@@ -442,154 +680,109 @@ class Y1DESMEDSImageIO(SVDESMEDSImageIO):
         # so (row,col) of nbr is
         #   (row,col)_nbr = J^(-1) x (u,v) + (row0,col0)
         J = cen_obs.get_jacobian()
-        Jinv = numpy.linalg.inv([[J.dudrow,J.dudcol],[J.dvdrow,J.dvdcol]])
         row0,col0 = J.get_cen()
-        rowcol_nbr = numpy.dot(Jinv,uv_nbr) + numpy.array([row0[0],col0[0]])
+        rowcol_nbr = numpy.linalg.solve([[J.dudrow,J.dudcol],[J.dvdrow,J.dvdcol]],uv_nbr) + numpy.array([row0[0],col0[0]])
 
         # 2a) now get new Jacobian
         J_nbr = J.copy() # or whatever
         J_nbr.set_cen(rowcol_nbr[0],rowcol_nbr[1])
 
         # 3) return it!
-        print('        did off-chip nbr %d for cen %d:' % (nbr_ind+1,cen_ind+1))
-        print('            band,cen_icut:     ',band,cen_obs.meta['icut'])
-        print('            u,v nbr:           ',uv_nbr)
-        print('            r,c nbr:           ',rowcol_nbr)
-        print('            box_size - r,c nbr:',self.meds_list[band]['box_size'][nbr_mindex]- rowcol_nbr)
+        print_with_verbosity('        did off-chip nbr %d for cen %d:' % (nbr_ind+1,cen_ind+1),verbosity=2)
+        print_with_verbosity('            band,cen_icut:     ',band,cen_obs.meta['icut'],verbosity=2)
+        print_with_verbosity('            u,v nbr:           ',uv_nbr,verbosity=2)
+        print_with_verbosity('            r,c nbr:           ',rowcol_nbr,verbosity=2)
+        print_with_verbosity('            box_size - r,c nbr:',self.meds_list[band]['box_size'][nbr_mindex]- rowcol_nbr,verbosity=2)
         return cen_obs.get_psf(),J_nbr
 
-    def _interpolate_maskbits(self,iobj,m1,icutout1,m2,icutout2):
-        rowcen1 = m1['cutout_row'][iobj,icutout1]
-        colcen1 = m1['cutout_col'][iobj,icutout1]
-        jacob1 = m1.get_jacobian_matrix(iobj,icutout1)
-        
-        rowcen2 = m2['cutout_row'][iobj,icutout2]
-        colcen2 = m2['cutout_col'][iobj,icutout2]
-        jacob2 = m2.get_jacobian_matrix(iobj,icutout2)
-        
-        im1 = m1.get_cutout(iobj,icutout1,type='bmask')
-        
-        msk = numpy.array([2048+1024+512+256+128+16+8+1],dtype='u4')
-        
-        q = numpy.where( ((im1&2 != 0) | (im1&4 != 0)) 
-                         & 
-                         (im1&32 != 0) 
-                         &
-                         (im1&msk == 0))
-        im1[:,:] = 0
-        im1[q] = 1
-        
-        assert m1['box_size'][iobj] == m2['box_size'][iobj]
-        assert m1['id'][iobj] == m2['id'][iobj]
+    def _get_satstar_masks(self,mb_obs_list):
+        """
+        get the saturated star masks of the good epochs of an object, with the
+        band and cutout index of each
+        """
+        mindex = mb_obs_list.meta['meds_index']
 
-        return interpolate_image(rowcen1, colcen1, jacob1, im1, 
-                                 rowcen2, colcen2, jacob2)[0]
-    
-    def _get_extra_bitmasks(self,coadd_mb_obs_list,mb_obs_list):        
+        masks = []
+        bands = []
+        icuts = []
+        for band,obs_list in enumerate(mb_obs_list):
+            for obs in obs_list:
+                if obs.meta['flags'] == 0:
+                    icut = obs.meta['icut']
+                    bmask = self.cutout_cache.get(self.meds_list[band],mindex,icut,'bmask')
+                    masks.append(get_satstar_mask(bmask))
+                    bands.append(band)
+                    icuts.append(icut)
+
+        return masks,bands,icuts
+
+    def _get_extra_bitmasks(self,coadd_mb_obs_list,mb_obs_list):
         marr = self.meds_list
         mindex = mb_obs_list.meta['meds_index']
-        
+
+        # the epoch masks do not depend on the target band, so get them once
+        masks,bands,icuts = self._get_satstar_masks(mb_obs_list)
+        if len(masks) > 0:
+            rowcen1 = [marr[band]['cutout_row'][mindex,icut] for band,icut in zip(bands,icuts)]
+            colcen1 = [marr[band]['cutout_col'][mindex,icut] for band,icut in zip(bands,icuts)]
+            jacobs1 = [marr[band].get_jacobian_matrix(mindex,icut) for band,icut in zip(bands,icuts)]
+
         bmasks = []
         for bandt,mt in enumerate(marr):
             bmask = numpy.zeros((mt['box_size'][mindex],mt['box_size'][mindex])).astype('i4')
-            
+
             # do the coadd
             if len(coadd_mb_obs_list[bandt]) > 0 and coadd_mb_obs_list[bandt][0].meta['flags'] == 0:
-                bmask |= mt.get_cutout(mindex,0,type='bmask')
-            
-            # do each band
-            for band,obs_list in enumerate(mb_obs_list):
-                for obs in obs_list:
-                    if obs.meta['flags'] == 0:                        
-                        bmaski = self._interpolate_maskbits(mindex,
-                                                            marr[band],
-                                                            obs.meta['icut'],
-                                                            mt,
-                                                            0)
-                        bmask |= bmaski
-    
+                bmask |= self.cutout_cache.get(mt,mindex,0,'bmask')
+
+            # do all epochs of each band at once
+            if len(masks) > 0:
+                for band in set(bands):
+                    assert marr[band]['box_size'][mindex] == mt['box_size'][mindex]
+                    assert marr[band]['id'][mindex] == mt['id'][mindex]
+
+                bmaskis = self.mask_engine.reproject(numpy.array(masks),
+                                                     rowcen1,
+                                                     colcen1,
+                                                     jacobs1,
+                                                     mt['cutout_row'][mindex,0],
+                                                     mt['cutout_col'][mindex,0],
+                                                     mt.get_jacobian_matrix(mindex,0))
+                bmask |= numpy.bitwise_or.reduce(bmaskis,axis=0)
+
             bmasks.append(bmask)
-            
-        return bmasks
 
-    def _expand_mask(self,bmask,rounds=1):
-        cbmask = bmask.copy()
-        
-        qx_prev,qy_prev = numpy.where(cbmask != 0)
-        
-        for r in xrange(rounds):
-            qx = []
-            qy = []
-            for ix,iy in zip(qx_prev,qy_prev):
-                for dx in [-1,0,1]:
-                    iix = ix + dx
-                    if iix >= 0 and iix < bmask.shape[0]:
-                        for dy in [-1,0,1]:
-                            iiy = iy + dy
-                            if iiy >= 0 and iiy < bmask.shape[1]:
-                                cbmask[iix,iiy] = 1
-                                qx.append(iix)
-                                qy.append(iiy)
-                                
-            qx_prev = numpy.array(qx)
-            qy_prev = numpy.array(qy)
-                            
-        return cbmask
+        return bmasks
 
     def _prop_extra_bitmasks(self, bmasks, mb_obs_list):
         mindex = mb_obs_list.meta['meds_index']
-            
+
         # interp to each image
         for band,obs_list in enumerate(mb_obs_list):
             m = self.meds_list[band]
             bmask = bmasks[band]
-            
-            for obs in obs_list:
-                if obs.meta['flags'] == 0:
-                    # interp
-                    icut = obs.meta['icut']
-                    
-                    rowcen1 = m['cutout_row'][mindex,0]
-                    colcen1 = m['cutout_col'][mindex,0]
-                    jacob1 = m.get_jacobian_matrix(mindex,0)
-                    
-                    rowcen2 = m['cutout_row'][mindex,icut]
-                    colcen2 = m['cutout_col'][mindex,icut]
-                    jacob2 = m.get_jacobian_matrix(mindex,icut)
-                    
-                    bmaski = interpolate_image(rowcen1, colcen1, jacob1, bmask,
-                                               rowcen2, colcen2, jacob2)[0]
-                    
-                    """
-                    if band == 0 and mb_obs_list.meta['id'] == 3076597980:
-                        import matplotlib.pyplot as plt
 
-                        fig,axs = plt.subplots(1,3)
-                        axs[0].imshow(bmaski)
-                        axs[1].imshow(self._expand_mask(bmaski,rounds=1))
-                        axs[2].imshow(self._expand_mask(bmaski,rounds=2))
-                        
-                        import ipdb
-                        ipdb.set_trace()
-                    """
-                    
-                    bmaski = self._expand_mask(bmaski,rounds=2)
-                    
-                    # now set weights to zero
-                    q = numpy.where((bmaski != 0) & (obs.seg == 0))
-                    if len(q[0]) > 0:
-                        print('    masked %d pixels due to saturation in any band' % q[0].size)
-                        if hasattr(obs,'weight_raw'):
-                            obs.weight_raw[q] = 0.0
-                            
-                        if hasattr(obs,'weight_us'):
-                            obs.weight_us[q] = 0.0
-                            
-                        if hasattr(obs,'weight'):
-                            obs.weight[q] = 0.0
-                            
-                        if hasattr(obs,'weight_orig'):
-                            obs.weight_orig[q] = 0.0        
+            good_obs = [obs for obs in obs_list if obs.meta['flags'] == 0]
+            if len(good_obs) == 0:
+                continue
+
+            # interp to all epochs at once
+            icuts = [obs.meta['icut'] for obs in good_obs]
+            bmaskis = self.mask_engine.reproject(bmask,
+                                                 m['cutout_row'][mindex,0],
+                                                 m['cutout_col'][mindex,0],
+                                                 m.get_jacobian_matrix(mindex,0),
+                                                 [m['cutout_row'][mindex,icut] for icut in icuts],
+                                                 [m['cutout_col'][mindex,icut] for icut in icuts],
+                                                 [m.get_jacobian_matrix(mindex,icut) for icut in icuts])
+            bmaskis = expand_mask(bmaskis,rounds=2)
+
+            for obs,bmaski in zip(good_obs,bmaskis):
+                # now set weights to zero
+                q = numpy.where((bmaski != 0) & (obs.seg == 0))
+                if len(q[0]) > 0:
+                    print('    masked %d pixels due to saturation in any band' % q[0].size)
+                    obsbuffers.set_pixels(obs,['weight_raw','weight_us','weight','weight_orig'],q,0.0)
 
     def _flag_y1_stellarhalo_masked_one(self,mb_obs_list):
         mindex = mb_obs_list.meta['meds_index']
@@ -604,7 +797,7 @@ class Y1DESMEDSImageIO(SVDESMEDSImageIO):
                 if obs.meta['flags'] == 0:
 
                     icut = obs.meta['icut']
-                    bmask = self.meds_list[band].get_cutout(mindex,icut,type='bmask')
+                    bmask = self.cutout_cache.get(self.meds_list[band],mindex,icut,'bmask')
                     
                     q = numpy.where((bmask&32 != 0) & (obs.seg == seg_number))
                     
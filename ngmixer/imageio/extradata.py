@@ -0,0 +1,154 @@
+"""
+join per-object side tables (obj flags, priors, past results, ...) to the
+objects by id
+"""
+from __future__ import print_function
+import numpy
+
+class IdJoin(object):
+    """
+    index of a table with one row per id
+
+        join = IdJoin(data, id_col='id')
+        rows = join.get_rows(ids)   # -1 where the id is not in the table
+        row = join.get_row(id)      # None if the id is not in the table
+    """
+    def __init__(self, data, id_col='id'):
+        self.data = data
+        self.id_col = id_col
+
+        ids = data[id_col]
+        self._sorter = numpy.argsort(ids, kind='mergesort')
+        self._sorted_ids = ids[self._sorter]
+        assert numpy.all(numpy.diff(self._sorted_ids) > 0),"ids in the %s column are not unique!" % id_col
+
+        self._id2row = None
+
+    def __len__(self):
+        return len(self.data)
+
+    def get_rows(self, ids):
+        """
+        rows of the table for an array of ids, -1 for ids not in the table
+        """
+        ids = numpy.atleast_1d(ids)
+        rows = numpy.zeros(len(ids), dtype='i8')
+        rows[:] = -1
+        if len(self._sorted_ids) == 0:
+            return rows
+
+        ind = numpy.searchsorted(self._sorted_ids, ids)
+        ind = numpy.clip(ind, 0, len(self._sorted_ids)-1)
+        w, = numpy.where(self._sorted_ids[ind] == ids)
+        rows[w] = self._sorter[ind[w]]
+        return rows
+
+    def get_row(self, id):
+        """
+        row of the table for one id, None if it is not in the table
+        """
+        if self._id2row is None:
+            ids = self.data[self.id_col]
+            self._id2row = dict(zip(ids.tolist(), xrange(len(ids))))
+        return self._id2row.get(id, None)
+
+class ExtraDataJoiner(object):
+    """
+    attach the rows of side tables to the meta data of MultiBandObsLists
+
+    Each table is added with a name.  By default the matched row is put in
+    meta[name], or None if the object is not in the table.  For tables of
+    flags, send flags_col and the flags are or'ed into meta['obj_flags']
+    instead.
+
+    Call set_ids with the ids of all objects, in mindex order, to match them
+    all at once and or the flags of all objects.  After that tag looks up
+    the rows and flags by mindex.
+
+        joiner = ExtraDataJoiner()
+        joiner.add('obj_flags', flags_data, flags_col='flags')
+        joiner.set_ids(meds['id'])
+        joiner.tag([coadd_mb_obs_list,me_mb_obs_list], mindex=mindex)
+    """
+    def __init__(self):
+        self.joins = []
+        self._rows = None
+        self._flags = None
+
+    def __len__(self):
+        return len(self.joins)
+
+    def add(self, name, data, id_col='id', flags_col=None):
+        """
+        add a table to join
+        """
+        self.joins.append((name, IdJoin(data, id_col=id_col), flags_col))
+        self._rows = None
+        self._flags = None
+
+    def set_ids(self, ids):
+        """
+        match all objects to the rows of each table at once
+        """
+        self._rows = {}
+        for name,join,flags_col in self.joins:
+            self._rows[name] = join.get_rows(ids)
+        self._flags = self.get_flags()
+
+    def get_flags(self):
+        """
+        or of the flags from all flag tables for the objects sent to set_ids,
+        None if there are no flag tables
+        """
+        assert self._rows is not None,"call set_ids before get_flags"
+        flags = None
+        for name,join,flags_col in self.joins:
+            if flags_col is None:
+                continue
+            rows = self._rows[name]
+            tflags = numpy.zeros(len(rows), dtype='i8')
+            w, = numpy.where(rows >= 0)
+            tflags[w] = join.data[flags_col][rows[w]]
+            if flags is None:
+                flags = tflags
+            else:
+                flags |= tflags
+        return flags
+
+    def tag(self, mb_obs_lists, mindex=None):
+        """
+        attach the rows for one object to the meta data of each of
+        mb_obs_lists
+
+        The object is looked up by mindex if set_ids was called and mindex
+        is sent, otherwise by the id in the meta data.
+        """
+        id = mb_obs_lists[0].meta['id']
+        for mb_obs_list in mb_obs_lists:
+            assert mb_obs_list.meta['id'] == id,"obs lists are not for the same object!"
+
+        by_mindex = self._rows is not None and mindex is not None
+
+        if by_mindex and self._flags is not None:
+            for mb_obs_list in mb_obs_lists:
+                mb_obs_list.meta['obj_flags'] |= self._flags[mindex]
+
+        for name,join,flags_col in self.joins:
+            if by_mindex and flags_col is not None:
+                # done above
+                continue
+            elif by_mindex:
+                row = self._rows[name][mindex]
+                if row < 0:
+                    row = None
+            else:
+                row = join.get_row(id)
+
+            for mb_obs_list in mb_obs_lists:
+                if flags_col is not None:
+                    if row is not None:
+                        mb_obs_list.meta['obj_flags'] |= join.data[flags_col][row]
+                elif row is not None:
+                    mb_obs_list.meta[name] = join.data[row]
+                else:
+                    mb_obs_list.meta[name] = None
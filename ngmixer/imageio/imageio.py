@@ -29,6 +29,12 @@ class ImageIO(object):
 
         ...
 
+    Readers that can build the obs lists for any fofindex directly (and not just
+    by iterating) should also define get_fof(fofindex). This method is used when
+    FoFs are handed out to a pool of worker processes. Each worker calls reopen()
+    once after it is started so that it does not share open file handles with
+    the parent process.
+
     Meta Data
     ---------
 
@@ -145,6 +151,28 @@ class ImageIO(object):
         """
         raise NotImplementedError("get_num_fofs method of ImageIO must be defined in subclass.")
 
+    def get_fof(self,fofindex):
+        """
+        returns coadd_mb_obs_lists,se_mb_obs_lists for the FoF at fofindex
+        """
+        raise NotImplementedError("get_fof method of ImageIO must be defined in subclass.")
+
+    def reopen(self):
+        """
+        reopen any files held by this object
+
+        called in worker processes after a fork
+        """
+        pass
+
+    def print_cache_stats(self):
+        """
+        print how well any caches of the reader did
+
+        called when the process that read the FoFs is done with them
+        """
+        pass
+
     def __iter__(self):
         self.fofindex = self.fof_start
         return self
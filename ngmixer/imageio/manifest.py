@@ -0,0 +1,105 @@
+"""
+per-tile manifest of the state derived at startup
+
+Every job on a tile opens the MEDS files, reduces the image flags, checks
+the psfex files, reads the WCS headers and indexes the FoFs and nbrs.  The
+manifest holds the results, made once by `megamixit setup`, so the jobs can
+read them instead.
+
+The manifest is a FITS file with one HDU per entry, named by the entry.
+"""
+from __future__ import print_function
+import os
+import json
+import numpy
+import fitsio
+
+MANIFEST_VERSION = 1
+
+class TileManifest(dict):
+    """
+    dict of named arrays, read from and written to a FITS file
+
+        manifest = TileManifest()
+        manifest['fof_offsets'] = offsets
+        manifest.write(fname)
+
+        manifest = TileManifest.read(fname)
+    """
+    @classmethod
+    def read(cls, fname):
+        fname = os.path.expandvars(fname)
+        print('reading tile manifest: %s' % fname)
+
+        manifest = cls()
+        with fitsio.FITS(fname) as fits:
+            hdr = fits[0].read_header()
+            version = hdr.get('MANVERS',-1)
+            if version != MANIFEST_VERSION:
+                raise ValueError("tile manifest %s has version %s, "
+                                 "expected %s" % (fname,version,MANIFEST_VERSION))
+
+            for hdu in fits[1:]:
+                manifest[hdu.get_extname()] = hdu.read()
+
+        return manifest
+
+    def write(self, fname):
+        """
+        write to a temporary file and move it into place
+        """
+        fname = os.path.expandvars(fname)
+        print('writing tile manifest: %s' % fname)
+
+        tmp = '%s.tmp%d' % (fname,os.getpid())
+        with fitsio.FITS(tmp,'rw',clobber=True) as fits:
+            fits.write(numpy.zeros(1,dtype='i2'),header={'MANVERS':MANIFEST_VERSION})
+            for name in sorted(self):
+                fits.write(self[name],extname=name)
+        os.rename(tmp,fname)
+
+def pack_headers(headers):
+    """
+    pack a dict of file_id -> header (or None) into a table, with the
+    headers as json strings
+    """
+    strings = []
+    file_ids = sorted(headers)
+    for file_id in file_ids:
+        hdr = headers[file_id]
+        if hdr is None:
+            strings.append('')
+        else:
+            strings.append(json.dumps(hdr))
+
+    slen = max([len(s) for s in strings] + [1])
+    data = numpy.zeros(len(file_ids),dtype=[('file_id','i8'),('header','S%d' % slen)])
+    data['file_id'] = file_ids
+    data['header'] = strings
+    return data
+
+def unpack_headers(data):
+    """
+    inverse of pack_headers
+    """
+    headers = {}
+    for file_id,hstr in zip(data['file_id'],data['header']):
+        hstr = hstr.strip()
+        if len(hstr) == 0:
+            headers[file_id] = None
+        else:
+            headers[file_id] = json.loads(hstr)
+    return headers
+
+def header_to_dict(hdr):
+    """
+    plain dict of the keywords in a FITS header that can be packed
+    """
+    d = {}
+    for key in hdr.keys():
+        if key in ['','COMMENT','HISTORY','CONTINUE']:
+            continue
+        val = hdr[key]
+        if isinstance(val,(int,long,float,bool,basestring)):
+            d[key] = val
+    return d
@@ -0,0 +1,166 @@
+"""
+array versions of the bit mask propagation for saturated stars
+
+The masks are the same as with util.interpolate_image and a pixel by pixel
+dilation, but all epochs of an object are reprojected in one call and the
+pixel coordinate grids are made once per cutout shape.
+"""
+from __future__ import print_function
+import numpy
+
+# bits that exclude a saturated pixel from the star mask
+SATSTAR_EXCLUDE = 2048+1024+512+256+128+16+8+1
+
+def get_satstar_mask(bmask):
+    """
+    1 where a bit mask has saturated (2 or 4) star (32) pixels without any
+    of the SATSTAR_EXCLUDE bits, 0 elsewhere
+
+    Works for a single cutout or a stack of them.
+    """
+    bmask = numpy.asarray(bmask)
+    q = ( ((bmask & 2 != 0) | (bmask & 4 != 0))
+          &
+          (bmask & 32 != 0)
+          &
+          (bmask & SATSTAR_EXCLUDE == 0) )
+    return q.astype('i4')
+
+def expand_mask(bmask, rounds=1):
+    """
+    set every pixel within rounds pixels (3x3 steps) of a non-zero pixel to 1
+
+    Works for a single cutout or a stack of them, in the last two axes.  A
+    copy is returned.
+    """
+    cbmask = bmask.copy()
+    if rounds <= 0:
+        return cbmask
+
+    grown = bmask != 0
+    for r in xrange(rounds):
+        # a 3x3 box is a 3 pixel step in rows then in cols
+        step = grown.copy()
+        step[...,1:,:] |= grown[...,:-1,:]
+        step[...,:-1,:] |= grown[...,1:,:]
+        grown = step.copy()
+        grown[...,:,1:] |= step[...,:,:-1]
+        grown[...,:,:-1] |= step[...,:,1:]
+
+    cbmask[grown] = 1
+    return cbmask
+
+class MaskEngine(object):
+    """
+    reprojects masks between cutouts of an object with their jacobians,
+    keeping the pixel grids for each cutout shape
+
+        engine = MaskEngine()
+        ims2 = engine.reproject(ims1, rowcen1, colcen1, jacobs1,
+                                rowcen2, colcen2, jacobs2)
+    """
+    def __init__(self):
+        self._grids = {}
+
+    def get_grid(self, shape):
+        """
+        the rows and cols of each pixel, as from numpy.mgrid, read-only
+        """
+        shape = tuple(shape)
+        if shape not in self._grids:
+            rows,cols = numpy.mgrid[0:shape[0], 0:shape[1]]
+            rows.flags.writeable = False
+            cols.flags.writeable = False
+            self._grids[shape] = (rows,cols)
+        return self._grids[shape]
+
+    def reproject(self, ims1, rowcen1, colcen1, jacobs1,
+                  rowcen2, colcen2, jacobs2):
+        """
+        interpolate (nearest pixel) from cutouts 1 to cutouts 2, which have
+        the same shape
+
+        The same as util.interpolate_image for each epoch.  Pixels of cutout
+        2 off of cutout 1 are zero.
+
+        parameters
+        ----------
+        ims1: array
+            a single image, used for all epochs, or a stack (nepoch,nrow,ncol)
+        rowcen1, colcen1, rowcen2, colcen2: scalars or arrays of length nepoch
+        jacobs1, jacobs2: a 2x2 jacobian or a list of nepoch of them
+
+        returns
+        -------
+        the (nepoch,nrow,ncol) reprojected images
+        """
+        ims1 = numpy.asarray(ims1)
+        nrow,ncol = ims1.shape[-2:]
+
+        jacobs1 = _get_jacobs(jacobs1)
+        jacobs2 = _get_jacobs(jacobs2)
+        rowcen1,colcen1,rowcen2,colcen2 = [numpy.asarray(x,dtype='f8').reshape(-1)
+                                           for x in [rowcen1,colcen1,rowcen2,colcen2]]
+        nepoch = max([len(x) for x in [jacobs1,jacobs2,rowcen1,colcen1,rowcen2,colcen2]])
+        if ims1.ndim == 3:
+            nepoch = max(nepoch,ims1.shape[0])
+
+        # to (nepoch,1,1) so they broadcast against the grids
+        rowcen1,colcen1,rowcen2,colcen2 = [_get_epoch_column(x,nepoch)
+                                           for x in [rowcen1,colcen1,rowcen2,colcen2]]
+        jacobs1 = _get_epoch_column(jacobs1,nepoch)
+        jacobs2 = _get_epoch_column(jacobs2,nepoch)
+
+        rows,cols = self.get_grid((nrow,ncol))
+        rows2 = rows - rowcen2
+        cols2 = cols - colcen2
+
+        jinv1 = numpy.linalg.inv(jacobs1)
+
+        # convert pixel coords in second cutout to u,v
+        u = rows2*jacobs2[...,0,0] + cols2*jacobs2[...,0,1]
+        v = rows2*jacobs2[...,1,0] + cols2*jacobs2[...,1,1]
+
+        # now convert into pixels for first image
+        row1 = rowcen1 + u*jinv1[...,0,0] + v*jinv1[...,0,1]
+        col1 = colcen1 + u*jinv1[...,1,0] + v*jinv1[...,1,1]
+
+        row1 = row1.round().astype('i8')
+        col1 = col1.round().astype('i8')
+
+        wbad = ((row1 < 0)    |
+                (row1 >= nrow) |
+                (col1 < 0)    |
+                (col1 >= ncol))
+
+        # clipping makes the notation easier
+        row1 = row1.clip(0,nrow-1)
+        col1 = col1.clip(0,ncol-1)
+
+        if ims1.ndim == 2:
+            ims2 = ims1[row1,col1]
+        else:
+            epochs = numpy.arange(nepoch).reshape(nepoch,1,1)
+            ims2 = ims1[epochs,row1,col1]
+        ims2[wbad] = 0
+
+        return ims2
+
+def _get_jacobs(jacobs):
+    """
+    jacobians as a (n,2,2) array, from a single one or a list
+    """
+    if isinstance(jacobs,(list,tuple)):
+        jacobs = [numpy.asarray(j,dtype='f8') for j in jacobs]
+        return numpy.array(jacobs).reshape(-1,2,2)
+    return numpy.asarray(jacobs,dtype='f8').reshape(-1,2,2)
+
+def _get_epoch_column(x, nepoch):
+    """
+    broadcast length 1 or nepoch arrays to nepoch, shaped to broadcast
+    against (nepoch,nrow,ncol)
+    """
+    if len(x) == 1:
+        x = numpy.repeat(x,nepoch,axis=0)
+    assert len(x) == nepoch,"need one entry or one per epoch"
+    return x.reshape((nepoch,1,1) + x.shape[1:])
@@ -0,0 +1,229 @@
+"""
+local cache of decompressed MEDS files
+
+Tile compressed MEDS files (.fits.fz) are decompressed tiles at a time on
+every read.  stage_meds writes an uncompressed copy once into a cache
+directory, which MmapMEDS then reads through memory maps.  Copies are
+keyed on the path and a checksum of the original file, so chunks of the
+same tile running on one node share them.
+"""
+from __future__ import print_function
+import os
+import re
+import glob
+import fcntl
+import hashlib
+import numpy
+import fitsio
+
+from .bulkmeds import BulkMEDS
+
+# pixels copied at a time when decompressing
+_COPY_NPIX = 2**24
+
+_BITPIX_DTYPES = {8:'u1',
+                  16:'>i2',
+                  32:'>i4',
+                  64:'>i8',
+                  -32:'>f4',
+                  -64:'>f8'}
+
+# names made by get_cached_name, the only files _trim_cache removes
+_CACHED_NAME_RE = re.compile(r'^.+-[0-9a-f]{32}\.fits$')
+
+def get_meds_checksum(fname):
+    """
+    checksum of a MEDS file from its path, size, modification time and
+    the DATASUM of its HDUs, if written
+    """
+    stat = os.stat(fname)
+    md5 = hashlib.md5()
+    md5.update(os.path.abspath(fname))
+    md5.update('%d %d' % (stat.st_size,int(stat.st_mtime)))
+    with fitsio.FITS(fname) as fits:
+        for hdu in fits:
+            hdr = hdu.read_header()
+            md5.update(str(hdr.get('DATASUM','')))
+    return md5.hexdigest()
+
+def get_cached_name(fname, cache_dir):
+    """
+    name of the decompressed copy of fname in cache_dir
+    """
+    bname = os.path.basename(fname).replace('.fits.fz','').replace('.fits','')
+    return os.path.join(cache_dir,'%s-%s.fits' % (bname,get_meds_checksum(fname)))
+
+def stage_meds(fname, cache_dir, max_bytes=None, open_func=None):
+    """
+    get a decompressed copy of the MEDS file in cache_dir, making it
+    if needed
+
+    The copy is written to a temporary file and renamed when done, under
+    a lock file, so concurrent jobs make it only once.  If max_bytes is
+    sent, the least recently used copies are removed until the cache
+    fits in it.
+
+    If open_func is sent, the copy is opened with open_func(path) while
+    the lock is held, so another job trimming the cache cannot remove it
+    first, and the opened object is returned.
+
+    returns
+    -------
+    the path to the copy, or open_func(path)
+    """
+    cache_dir = os.path.expandvars(cache_dir)
+    if not os.path.exists(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # made by another job
+            if not os.path.isdir(cache_dir):
+                raise
+
+    cached = get_cached_name(fname, cache_dir)
+
+    with open(cached+'.lock','w') as lock:
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        try:
+            if os.path.exists(cached):
+                # mark as recently used
+                os.utime(cached,None)
+            else:
+                print('decompressing %s -> %s' % (fname,cached))
+                tmp = '%s.tmp%d' % (cached,os.getpid())
+                _decompress(fname,tmp)
+                os.rename(tmp,cached)
+
+            if max_bytes is not None:
+                _trim_cache(cache_dir,max_bytes,keep=cached)
+
+            if open_func is not None:
+                return open_func(cached)
+        finally:
+            fcntl.flock(lock,fcntl.LOCK_UN)
+
+    return cached
+
+def _decompress(fname, output):
+    """
+    copy all HDUs of fname to output without compression
+    """
+    with fitsio.FITS(fname) as fits:
+        with fitsio.FITS(output,'rw',clobber=True) as out:
+            for hdu in fits:
+                extname = hdu.get_extname()
+                if hdu.get_exttype() == 'IMAGE_HDU':
+                    dims = hdu.get_dims()
+                    if len(dims) == 0:
+                        continue
+                    assert len(dims) == 1,"expected 1-d cutout images in %s[%s]" % (fname,extname)
+
+                    npix = dims[0]
+                    dtype = hdu[0:1].dtype
+                    out.create_image_hdu(dims=[npix],dtype=dtype,extname=extname)
+                    for start in xrange(0,npix,_COPY_NPIX):
+                        stop = min(start+_COPY_NPIX,npix)
+                        out[-1].write(hdu[start:stop],start=start)
+                else:
+                    out.write(hdu.read(),extname=extname)
+
+def _trim_cache(cache_dir, max_bytes, keep=None):
+    """
+    remove the least recently used copies until the cache fits in max_bytes
+
+    Only files named as by get_cached_name are removed, and only when their
+    lock can be taken without waiting, so a copy another job is making or
+    opening is skipped.  Removing a copy that another job has open is safe,
+    it stays readable until that job closes it.
+    """
+    fnames = [f for f in glob.glob(os.path.join(cache_dir,'*.fits'))
+              if _CACHED_NAME_RE.match(os.path.basename(f))]
+    fnames.sort(key=lambda f: os.stat(f).st_mtime)
+    sizes = [os.stat(f).st_size for f in fnames]
+
+    total = sum(sizes)
+    for fname,size in zip(fnames,sizes):
+        if total <= max_bytes:
+            break
+        if fname == keep:
+            continue
+        if _remove_cached(fname):
+            total -= size
+
+    # lock files left by copies removed earlier
+    for lock_name in glob.glob(os.path.join(cache_dir,'*.fits.lock')):
+        fname = lock_name[:-len('.lock')]
+        if (fname != keep
+                and _CACHED_NAME_RE.match(os.path.basename(fname))
+                and not os.path.exists(fname)):
+            _remove_cached(fname)
+
+def _remove_cached(fname):
+    """
+    remove a copy and its lock file, holding its lock; False if the lock is
+    held by another job
+    """
+    try:
+        lock = open(fname+'.lock','a')
+    except (IOError,OSError):
+        return False
+
+    with lock:
+        try:
+            fcntl.flock(lock,fcntl.LOCK_EX|fcntl.LOCK_NB)
+        except (IOError,OSError):
+            return False
+
+        try:
+            if os.path.exists(fname):
+                print('removing cached MEDS file: %s' % fname)
+                os.remove(fname)
+            os.remove(fname+'.lock')
+        finally:
+            fcntl.flock(lock,fcntl.LOCK_UN)
+
+    return True
+
+class MmapMEDS(BulkMEDS):
+    """
+    BulkMEDS that reads the cutouts of an uncompressed MEDS file through
+    memory maps, so getting the cutouts of an object is a slice of the map
+
+    Compressed or scaled cutout HDUs are read with fitsio as usual.  The
+    maps use a file opened here, so they keep working if the copy is later
+    removed from the cache.
+    """
+    def __init__(self, filename, **kw):
+        super(MmapMEDS,self).__init__(filename, **kw)
+        self._mmap_file = open(os.path.expandvars(filename),'rb')
+        self._mmaps = {}
+
+    def _get_mmap(self, extname):
+        """
+        memory map of the data of a cutout HDU, None if it cannot be mapped
+        """
+        if extname not in self._mmaps:
+            hdu = self._fits[extname]
+            hdr = hdu.read_header()
+
+            mmap = None
+            if (not hdu.is_compressed()
+                    and hdr.get('NAXIS',0) == 1
+                    and hdr.get('BZERO',0) == 0
+                    and hdr.get('BSCALE',1) == 1
+                    and hdr['BITPIX'] in _BITPIX_DTYPES):
+                data_start = hdu.get_offsets()[1]
+                mmap = numpy.memmap(self._mmap_file,
+                                    dtype=_BITPIX_DTYPES[hdr['BITPIX']],
+                                    mode='r',
+                                    offset=data_start,
+                                    shape=(hdr['NAXIS1'],))
+            self._mmaps[extname] = mmap
+
+        return self._mmaps[extname]
+
+    def _read_flat(self, extname, start, npix):
+        mmap = self._get_mmap(extname)
+        if mmap is None:
+            return super(MmapMEDS,self)._read_flat(extname, start, npix)
+        return mmap[start:start+npix]
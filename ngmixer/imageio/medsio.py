@@ -13,7 +13,16 @@ from ngmix import Observation, ObsList, MultiBandObsList
 # local imports
 from .imageio import ImageIO
 from ..defaults import DEFVAL,IMAGE_FLAGS
+from ..timing import TIMER
+from ..util import print_with_verbosity
+from .prefetch import Prefetcher
+from .bulkmeds import BulkMEDS, get_cutout_view
+from .medscache import stage_meds, MmapMEDS
+from .extradata import ExtraDataJoiner
+from .manifest import TileManifest
+from .cutoutcache import CutoutCache
 from .. import nbrsfofs
+from .. import obsbuffers
 
 class MEDSImageIO(ImageIO):
     """
@@ -34,6 +43,12 @@ class MEDSImageIO(ImageIO):
         super(MEDSImageIO, self).__init__(*args,**kwargs)
         self.conf = args[0]
         self._set_defaults()
+
+        # state shared by all jobs on the tile
+        if self.conf['tile_manifest'] is not None:
+            self.manifest = TileManifest.read(self.conf['tile_manifest'])
+        else:
+            self.manifest = None
         if self.conf['reject_outliers']:
             print("will reject outliers")
 
@@ -61,21 +76,69 @@ class MEDSImageIO(ImageIO):
         # indexing of fofs
         self._set_and_check_index_lookups()
 
+        # per-object side tables
+        self._set_extra_data_joins()
+
         # psfs
         self._load_psf_data()
 
+        # mask cutouts of the current FoF
+        self.cutout_cache = CutoutCache()
+
         # make sure if we are doing nbrs we have the info we need
         if self.conf['model_nbrs']:
-            assert 'nbrs' in self.extra_data,"You must supply a nbrs file to model nbrs!"
+            if self.manifest is not None and 'nbrs_offsets' in self.manifest:
+                self.nbrs_index = nbrsfofs.NbrsIndex(self.manifest['nbrs_numbers'],
+                                                     self.manifest['nbrs_offsets'],
+                                                     self.manifest['nbrs_nbr_numbers'])
+            else:
+                assert 'nbrs' in self.extra_data,"You must supply a nbrs file to model nbrs!"
+                self.nbrs_index = nbrsfofs.NbrsIndex.from_nbrs_data(self.extra_data['nbrs'])
 
     def _set_defaults(self):
         self.conf['min_weight'] = self.conf.get('min_weight',-numpy.inf)
         self.conf['reject_outliers'] = self.conf.get('reject_outliers',True) # from cutouts
         self.conf['model_nbrs'] = self.conf.get('model_nbrs',False)
 
+        # number of FoFs to read ahead in a reader process while
+        # fitting, and a cap on the memory they hold
+        self.conf['prefetch'] = self.conf.get('prefetch',0)
+        self.conf['prefetch_max_mb'] = self.conf.get('prefetch_max_mb',None)
+
+        # read all cutouts of an object in one read per cutout type
+        self.conf['bulk_reads'] = self.conf.get('bulk_reads',False)
+
+        # decompress the MEDS files once into a local cache and read them
+        # through memory maps; the cache defaults to work_dir/meds_cache
+        self.conf['meds_cache'] = self.conf.get('meds_cache',False)
+        self.conf['meds_cache_dir'] = self.conf.get('meds_cache_dir',None)
+        self.conf['meds_cache_max_gb'] = self.conf.get('meds_cache_max_gb',None)
+
+        # directory for files shared by all jobs on a tile
+        self.conf['tile_cache_dir'] = self.conf.get('tile_cache_dir',None)
+
+        # manifest of the startup state of the tile, see TileManifest
+        self.conf['tile_manifest'] = self.conf.get('tile_manifest',None)
+
+        # read fof ranges from the full files instead of extracting them
+        self.conf['virtual_fof_range'] = self.conf.get('virtual_fof_range',False)
+
+        # save the FoF index next to the FoF file for later jobs
+        self.conf['fof_index_cache'] = self.conf.get('fof_index_cache',False)
+
+        # extra data tables to join to the objects by id
+        self.conf['extra_data_joins'] = self.conf.get('extra_data_joins',{})
+
     def _load_psf_data(self):
         pass
 
+    def _start_fof(self, mindexes):
+        """
+        Called with the mindexes of the FoF members before reading them, for
+        work done for all members at once
+        """
+        pass
+
     def _get_psf_image(self, band, mindex, icut):
         """
         Get an image representing the psf
@@ -110,10 +173,10 @@ class MEDSImageIO(ImageIO):
                 extracted.append(ex)
             extracted.append(None)
         else:
-            # do the fofs first
+            # do the fofs first, in memory
             print(self.fof_file)
-            newf = self._get_sub_fname(self.fof_file)
-            fofex = nbrsfofs.NbrsFoFExtractor(self.fof_file, self.fof_range[0], self.fof_range[1], newf, cleanup=True)
+            fofex = nbrsfofs.NbrsFoFExtractor(self.fof_file, self.fof_range[0], self.fof_range[1],
+                                              index_cache=self.conf['fof_index_cache'])
 
             # now do the meds
             for f in self.meds_files:
@@ -128,17 +191,17 @@ class MEDSImageIO(ImageIO):
     def _setup_work_files(self):
         """
         Set up local, possibly sub-range meds files
+
+        With virtual_fof_range set, no sub-range files are made.  The full
+        files are read and the FoF index maps the range to their mindexes.
         """
         self.meds_files_full = self.meds_files
         self.fof_file_full = self.fof_file
         self.extracted=None
-        if self.fof_range is not None:
+        if self.fof_range is not None and not self.conf['virtual_fof_range']:
             extracted=self._get_sub()
-            meds_files=[ex.sub_file for ex in extracted if ex is not None]
-            if extracted[-1] is not None:
-                self.fof_file = extracted[-1].sub_file
-                meds_files = meds_files[:-1]
-            self.meds_files = meds_files
+            # the FoF rows are extracted in memory, the fof_file stays the full one
+            self.meds_files = [ex.sub_file for ex in extracted[:-1]]
             self.extracted = extracted
 
     def _set_and_check_index_lookups(self):
@@ -160,63 +223,114 @@ class MEDSImageIO(ImageIO):
 
         We require that the FoF file number column matches the MEDS file, line-by-line.
 
-        We do however build some lookup tables to enable easy translation. They are
+        We do however build a lookup table to enable easy translation.
 
-            self.fofid2mindex = this is a dict keyed on the fofid - it returns the set of mindexes
-                that give the members of the FoF group
-            self.number2mindex = lookup table for converting numbers to mindexes
-        These are both dictionaries which use python's hashing of keys. There may be a performance
-        issue here, in terms of building the dicts, for large numbers of objects.
-        """
+            self.fof_index = a nbrsfofs.FoFIndex, which holds the mindexes of the members
+                of each FoF as offsets and members arrays, so the members of the FoF at
+                fofindex are self.fof_index.get_members(fofindex)
 
-        # warn the user
-        print('making fof indexes')
+        The index is built with a sort of the fofids. If fof_index_cache is set, it is
+        saved next to the FoF file so later jobs can read it.
+        """
 
-        if self.fof_file is not None:
-            read_fofs = True
-            self.fof_data = fitsio.read(self.fof_file)
+        # read the full tile index from the manifest if we have the full tile
+        if (self.manifest is not None
+                and 'fof_members' in self.manifest
+                and self.fof_file is not None
+                and self.extracted is None):
+            self.fof_index = nbrsfofs.FoFIndex(self.manifest['fof_fofids'],
+                                               self.manifest['fof_offsets'],
+                                               self.manifest['fof_members'])
+            assert len(self.fof_index.members) == self.meds_list[0].size,"tile manifest FoFs do not match the MEDS files!"
         else:
-            read_fofs = False
-            nobj = len(self.meds_list[0]['number'])
-            self.fof_data = numpy.zeros(nobj,dtype=[('fofid','i8'),('number','i8')])
-            self.fof_data['fofid'][:] = numpy.arange(nobj)
-            self.fof_data['number'][:] = self.meds_list[0]['number'][:]
+            # warn the user
+            print('making fof indexes')
+
+            fof_file = self.fof_file
+            if self.extracted is not None and self.extracted[-1] is not None:
+                # the FoFs of the range, no index cache for those
+                self.fof_data = self.extracted[-1].data
+                fof_file = None
+            elif self.fof_file is not None:
+                self.fof_data = fitsio.read(self.fof_file)
+            else:
+                self.fof_data = nbrsfofs.get_dummy_fofs(self.meds_list[0]['number'])
+
+            # first, we error check
+            for band,meds in enumerate(self.meds_list):
+                msg = "FoF number is not the same as MEDS number for band %d!" % band
+                assert numpy.array_equal(meds['number'],self.fof_data['number']),msg
 
-        # first, we error check
-        for band,meds in enumerate(self.meds_list):
-            msg = "FoF number is not the same as MEDS number for band %d!" % band
-            assert numpy.array_equal(meds['number'],self.fof_data['number']),msg
+            self.fof_index = nbrsfofs.get_fof_index(self.fof_data,
+                                                    fof_file=fof_file,
+                                                    cache=self.conf['fof_index_cache'])
 
+        # in virtual mode, restrict to the range of FoFs in the full files
+        if self.fof_range is not None and self.extracted is None:
+            self.fof_index = self.fof_index.get_sub_index(self.fof_range[0],self.fof_range[1])
+            print('using %d FoFs in range %d-%d of the full files' % (len(self.fof_index),
+                                                                     self.fof_range[0],
+                                                                     self.fof_range[1]))
 
         #set some useful stuff here
-        self.fofids = numpy.unique(self.fof_data['fofid'])
-        self.fofids = numpy.sort(self.fofids)
-        self.num_fofs = len(self.fofids)
-
-        if read_fofs:
-            #build the fof hash
-            self.fofid2mindex = {}
-            for fofid in self.fofids:
-                q, = numpy.where(self.fof_data['fofid'] == fofid)
-                assert len(q) > 0, 'Found zero length FoF! fofid = %ld' % fofid
-                assert numpy.array_equal(self.fof_data['number'][q],self.meds_list[0]['number'][q])
-                self.fofid2mindex[fofid] = q.copy()
-        else:
-            #use a list of lists since is much faster to make
-            self.fofid2mindex = []
-            for fofid in self.fofids:
-                self.fofid2mindex.append([fofid])
-                assert self.fofid2mindex[fofid][0] == fofid
-
-    def _flag_objects(coadd_mb_obs_lists,me_mb_obs_lists,mindexes):
-        qnz, = numpy.where(self.extra_data['obj_flags']['flags'] != 0)
+        self.fofids = self.fof_index.fofids
+        self.num_fofs = len(self.fof_index)
+
+    def get_manifest(self):
+        """
+        Get a TileManifest with the startup state of this reader, which
+        should be made for the full tile
+        """
+        manifest = TileManifest()
+
+        if self.fof_file is not None:
+            manifest['fof_fofids'] = self.fof_index.fofids
+            manifest['fof_offsets'] = self.fof_index.offsets
+            manifest['fof_members'] = self.fof_index.members
+
+        if self.conf['model_nbrs']:
+            manifest['nbrs_numbers'] = self.nbrs_index.numbers
+            manifest['nbrs_offsets'] = self.nbrs_index.offsets
+            manifest['nbrs_nbr_numbers'] = self.nbrs_index.nbr_numbers
+
+        return manifest
+
+    def write_manifest(self, fname):
+        """
+        write the TileManifest for the tile
+        """
+        assert self.fof_range is None,"the tile manifest must be made for the full tile"
+        self.get_manifest().write(fname)
+
+    def _set_extra_data_joins(self):
+        """
+        index the per-object side tables in extra_data by id and match them
+        to all objects at once
+
+        Non-zero obj_flags are or'ed into meta['obj_flags'].  The tables named
+        in the extra_data_joins config, a dict of name -> {'id_col':...}, have
+        their matched row put in meta[name].
+        """
+        self.extra_data_joiner = ExtraDataJoiner()
+
+        if 'obj_flags' in self.extra_data:
+            obj_flags = self.extra_data['obj_flags']
+            obj_flags = obj_flags[obj_flags['flags'] != 0]
+            self.extra_data_joiner.add('obj_flags',obj_flags,flags_col='flags')
+
+        for name in sorted(self.conf['extra_data_joins']):
+            assert name in self.extra_data,"extra data %s to join was not sent!" % name
+            id_col = self.conf['extra_data_joins'][name].get('id_col','id')
+            self.extra_data_joiner.add(name,self.extra_data[name],id_col=id_col)
+
+        self.extra_data_joiner.set_ids(self.meds_list[0]['id'])
+
+    def _join_extra_data(self,coadd_mb_obs_lists,me_mb_obs_lists,mindexes):
+        """
+        attach the extra data to the obs lists of each object
+        """
         for mindex,coadd_mb_obs_list,me_mb_obs_list in zip(mindexes,coadd_mb_obs_lists,me_mb_obs_lists):
-            q, = numpy.where(self.extra_data['obj_flags']['id'][qnz] == me_mb_obs_list.meta['id'])
-            if len(q) > 0:
-                assert len(q) == 1
-                assert me_mb_obs_list.meta['id'] ==  self.extra_data['obj_flags']['id'][qnz[q[0]]]
-                coadd_mb_obs_list.meta['obj_flags'] |= self.extra_data['obj_flags']['flags'][qnz[q[0]]]
-                me_mb_obs_list.meta['obj_flags'] |= self.extra_data['obj_flags']['flags'][qnz[q[0]]]
+            self.extra_data_joiner.tag([coadd_mb_obs_list,me_mb_obs_list],mindex=mindex)
 
     def _add_nbrs_info(self,coadd_mb_obs_lists,me_mb_obs_lists,mindexes):
         """
@@ -227,31 +341,32 @@ class MEDSImageIO(ImageIO):
         for mb_obs_list in coadd_mb_obs_lists:
             for obs_list in mb_obs_list:
                 for obs in obs_list:
-                    obs.image_orig = obs.image.copy()
-                    obs.weight_orig = obs.weight.copy()
+                    obs.image_orig = obsbuffers.share(obs.image)
+                    obs.weight_orig = obsbuffers.share(obs.weight)
 
         for mb_obs_list in me_mb_obs_lists:
             for obs_list in mb_obs_list:
                 for obs in obs_list:
-                    obs.image_orig = obs.image.copy()
-                    obs.weight_orig = obs.weight.copy()
+                    obs.image_orig = obsbuffers.share(obs.image)
+                    obs.weight_orig = obsbuffers.share(obs.weight)
 
         # do indexes
-        for cen,mindex in enumerate(mindexes):
+        numbers = self.meds_list[0]['number'][mindexes]
+        ids = self.meds_list[0]['id'][mindexes]
+        number2pos = dict((number,pos) for pos,number in enumerate(numbers))
+        for cen in xrange(len(mindexes)):
             nbrs_inds = []
             nbrs_ids = []
 
             # if len is 1, then only a single galaxy in the FoF and do nothing
             if len(mindexes) > 1:
-                q, = numpy.where(self.extra_data['nbrs']['number'] == self.meds_list[0]['number'][mindex])
-                for ind in q:
-                    if self.extra_data['nbrs']['nbr_number'][ind] != -1:
-                        qi, = numpy.where(self.meds_list[0]['number'][mindexes] == self.extra_data['nbrs']['nbr_number'][ind])
-                        assert len(qi) == 1
-                        nbrs_inds.append(qi[0])
-                        nbrs_ids.append(self.meds_list[0]['id'][mindexes[qi[0]]])
-                        assert coadd_mb_obs_lists[nbrs_inds[-1]].meta['id'] == nbrs_ids[-1]
-                        assert me_mb_obs_lists[nbrs_inds[-1]].meta['id'] == nbrs_ids[-1]
+                for nbr_number in self.nbrs_index.get_nbrs(numbers[cen]):
+                    assert nbr_number in number2pos,'nbr %d is not in the FoF!' % nbr_number
+                    pos = number2pos[nbr_number]
+                    nbrs_inds.append(pos)
+                    nbrs_ids.append(ids[pos])
+                    assert coadd_mb_obs_lists[pos].meta['id'] == nbrs_ids[-1]
+                    assert me_mb_obs_lists[pos].meta['id'] == nbrs_ids[-1]
 
                 assert cen not in nbrs_inds,'weird error where cen_ind is in nbrs_ind!'
 
@@ -398,37 +513,129 @@ class MEDSImageIO(ImageIO):
 
         return meta
 
+    def __iter__(self):
+        self.fofindex = self.fof_start
+        self._stop_prefetch()
+
+        if self.conf['prefetch'] > 0 and self.fofindex < self.num_fofs:
+            if self.conf['prefetch_max_mb'] is not None:
+                max_bytes = int(self.conf['prefetch_max_mb']*1024*1024)
+            else:
+                max_bytes = None
+            self.prefetcher = Prefetcher(self.get_fof,
+                                         xrange(self.fofindex,self.num_fofs),
+                                         nahead=self.conf['prefetch'],
+                                         max_bytes=max_bytes,
+                                         reopen=self.reopen,
+                                         finish=self.print_cache_stats)
+        return self
+
+    def _stop_prefetch(self):
+        if getattr(self,'prefetcher',None) is not None:
+            self.prefetcher.stop()
+        self.prefetcher = None
+
     def __next__(self):
         if self.fofindex >= self.num_fofs:
+            if getattr(self,'prefetcher',None) is not None:
+                # the FoFs were read, and the caches used, by the reader
+                self.prefetcher.join()
+            else:
+                self.print_cache_stats()
+            self._stop_prefetch()
             raise StopIteration
         else:
-            fofid = self.fofids[self.fofindex]
-            mindexes = self.fofid2mindex[fofid]
-            coadd_mb_obs_lists = []
-            me_mb_obs_lists = []
-            for mindex in mindexes:
-                print('  getting obj w/ id %d' % self.meds_list[0]['id'][mindex])
-                
+            if getattr(self,'prefetcher',None) is not None:
+                coadd_mb_obs_lists,me_mb_obs_lists = self.prefetcher.get()
+            else:
+                coadd_mb_obs_lists,me_mb_obs_lists = self.get_fof(self.fofindex)
+            self.fofindex += 1
+            return coadd_mb_obs_lists,me_mb_obs_lists
+
+    next = __next__
+
+    def get_fof(self,fofindex):
+        """
+        get the coadd and SE obs lists for all members of the FoF at fofindex
+        """
+        fofid = self.fofids[fofindex]
+        mindexes = self.fof_index.get_members(fofindex)
+        self.cutout_cache.clear()
+        with TIMER('read'):
+            self._start_fof(mindexes)
+
+        coadd_mb_obs_lists = []
+        me_mb_obs_lists = []
+        for mindex in mindexes:
+            print('  getting obj w/ id %d' % self.meds_list[0]['id'][mindex])
+
+            TIMER.reset_object()
+            with TIMER('read'):
                 c,me = self._get_multi_band_observations(mindex)
-                
-                # add fof ids here
-                if self.fof_file is not None:
-                    c.meta['meta_data']['fofid'][:] = fofid
-                    me.meta['meta_data']['fofid'][:] = fofid
-                
-                coadd_mb_obs_lists.append(c)
-                me_mb_obs_lists.append(me)
+            me.update_meta_data({'time_read':TIMER.get_object_time('read')})
 
-            if 'obj_flags' in self.extra_data:
-                self._flag_objects(coadd_mb_obs_lists,me_mb_obs_lists,mindexes)
+            # add fof ids here
+            if self.fof_file is not None:
+                c.meta['meta_data']['fofid'][:] = fofid
+                me.meta['meta_data']['fofid'][:] = fofid
 
-            if self.conf['model_nbrs']:
-                self._add_nbrs_info(coadd_mb_obs_lists,me_mb_obs_lists,mindexes)
+            coadd_mb_obs_lists.append(c)
+            me_mb_obs_lists.append(me)
 
-            self.fofindex += 1
-            return coadd_mb_obs_lists,me_mb_obs_lists
+        if len(self.extra_data_joiner) > 0:
+            self._join_extra_data(coadd_mb_obs_lists,me_mb_obs_lists,mindexes)
 
-    next = __next__
+        if self.conf['model_nbrs']:
+            self._add_nbrs_info(coadd_mb_obs_lists,me_mb_obs_lists,mindexes)
+
+        # the observations keep the cutouts they use
+        self.cutout_cache.clear()
+        for meds in self.meds_list:
+            if isinstance(meds, BulkMEDS):
+                meds.clear_cache()
+
+        return coadd_mb_obs_lists,me_mb_obs_lists
+
+    def reopen(self):
+        """
+        reopen the MEDS files
+
+        cfitsio keeps its own idea of the file position, so a forked process
+        must not read through the file handles of its parent
+        """
+        self.cutout_cache.clear()
+        self.meds_list = []
+        for funexp in self.meds_files:
+            f = os.path.expandvars(funexp)
+            self.meds_list.append(self._open_meds(f))
+
+    def print_cache_stats(self):
+        """
+        print the hits and misses of the cutout cache
+        """
+        print_with_verbosity('cutout cache: %d hits, %d misses' % (self.cutout_cache.nhit,
+                                                                  self.cutout_cache.nmiss),
+                             verbosity=1)
+
+    def _open_meds(self, fname):
+        """
+        open a MEDS file for reading cutouts
+        """
+        if self.conf['meds_cache']:
+            cache_dir = self.conf['meds_cache_dir']
+            if cache_dir is None:
+                cache_dir = os.path.join(self.conf['work_dir'],'meds_cache')
+
+            if self.conf['meds_cache_max_gb'] is not None:
+                max_bytes = int(self.conf['meds_cache_max_gb']*1024**3)
+            else:
+                max_bytes = None
+
+            return stage_meds(fname, cache_dir, max_bytes=max_bytes, open_func=MmapMEDS)
+        elif self.conf['bulk_reads']:
+            return BulkMEDS(fname)
+        else:
+            return meds.MEDS(fname)
 
     def _get_multi_band_observations(self, mindex):
         """
@@ -461,7 +668,7 @@ class MEDSImageIO(ImageIO):
         for obs in obs_list:
             if obs.meta['flags'] == 0:
                 imlist.append(obs.image)
-                wtlist.append(obs.weight)
+                wtlist.append(obsbuffers.get_writable(obs,'weight'))
 
         # weight map is modified
         nreject=meds.reject_outliers(imlist,wtlist)
@@ -541,22 +748,22 @@ class MEDSImageIO(ImageIO):
         fname = self._get_meds_orig_filename(meds, mindex, icut)
         im = self._get_meds_image(meds, mindex, icut)
         wt,wt_us,seg = self._get_meds_weight(meds, mindex, icut)
-        jacob = self._get_jacobian(meds, mindex, icut)
 
         # for the psf fitting code
-        wt=wt.clip(min=0.0)
+        if (wt < 0.0).any():
+            wt=wt.clip(min=0.0)
+
+        jacob = self._get_jacobian(meds, mindex, icut)
 
         psf_obs = self._get_psf_observation(band, mindex, icut, jacob)
 
+        # the weight maps are shared, see obsbuffers
         obs=Observation(im,
-                        weight=wt.copy(),
+                        weight=obsbuffers.share(wt),
                         jacobian=jacob,
                         psf=psf_obs)
-        if wt_us is not None:
-            obs.weight_us = wt_us.copy()
-        else:
-            obs.weight_us = None
-        obs.weight_raw = wt.copy()
+        obs.weight_us = obsbuffers.share(wt_us)
+        obs.weight_raw = wt
         obs.seg = seg
         obs.filename=fname
 
@@ -589,9 +796,10 @@ class MEDSImageIO(ImageIO):
 
     def _get_meds_image(self, meds, mindex, icut):
         """
-        Get an image cutout from the input MEDS file
+        Get an image cutout from the input MEDS file, which can be a
+        read-only view, see bulkmeds.get_cutout_view
         """
-        im = meds.get_cutout(mindex, icut)
+        im = get_cutout_view(meds, mindex, icut)
         im = im.astype('f8', copy=False)
         return im
 
@@ -599,9 +807,31 @@ class MEDSImageIO(ImageIO):
         """
         Get a weight map from the input MEDS file
         """
+        wt,wt_us,seg = self._read_meds_weight(meds, mindex, icut)
+
+        w = numpy.where(wt < self.conf['min_weight'])
+        if w[0].size > 0:
+            if not wt.flags.writeable:
+                wt = wt.copy()
+            wt[w] = 0.0
+
+        if wt_us is not None:
+            w = numpy.where(wt_us < self.conf['min_weight'])
+            if w[0].size > 0:
+                if not wt_us.flags.writeable:
+                    wt_us = wt_us.copy()
+                wt_us[w] = 0.0
+
+        return wt,wt_us,seg
+
+    def _read_meds_weight(self, meds, mindex, icut):
+        """
+        Read the weight maps and seg map from the input MEDS file, without
+        the min_weight cut; the maps can be read-only
+        """
 
         if self.conf['region'] == 'mof':
-            wt = meds.get_cutout(mindex, icut, type='weight')
+            wt = get_cutout_view(meds, mindex, icut, type='weight')
             wt_us = meds.get_cweight_cutout_nearest(mindex, icut)
         elif self.conf['region'] == "cweight-nearest":
             wt = meds.get_cweight_cutout_nearest(mindex, icut)
@@ -610,26 +840,16 @@ class MEDSImageIO(ImageIO):
             wt=meds.get_cweight_cutout(mindex, icut)
             wt_us = None
         elif self.conf['region'] == 'weight':
-            wt=meds.get_cutout(mindex, icut, type='weight')
+            wt=get_cutout_view(meds, mindex, icut, type='weight')
             wt_us = None
         else:
             raise ValueError("no support for region type %s" % self.conf['region'])
 
         wt = wt.astype('f8', copy=False)
-        w = numpy.where(wt < self.conf['min_weight'])
-        if w[0].size > 0:
-            wt[w] = 0.0
-
         if wt_us is not None:
             wt_us = wt_us.astype('f8', copy=False)
-            w = numpy.where(wt_us < self.conf['min_weight'])
-            if w[0].size > 0:
-                wt_us[w] = 0.0
 
-        try:
-            seg = meds.interpolate_coadd_seg(mindex, icut)
-        except:
-            seg = meds.get_cutout(mindex, icut, type='seg')
+        seg = self.cutout_cache.get(meds, mindex, icut, 'coadd_seg')
 
         return wt,wt_us,seg
 
@@ -678,7 +898,7 @@ class MEDSImageIO(ImageIO):
         for i,funexp in enumerate(self.meds_files):
             f = os.path.expandvars(funexp)
             print('band %d meds: %s' % (i,f))
-            medsi=meds.MEDS(f)
+            medsi=self._open_meds(f)
             medsi_meta=medsi.get_meta()
 
             if i==0:
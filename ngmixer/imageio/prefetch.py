@@ -0,0 +1,193 @@
+"""
+read FoFs ahead of the fitting in a reader process
+"""
+from __future__ import print_function
+import traceback
+import multiprocessing
+import Queue
+import numpy
+
+def get_obs_nbytes(mb_obs_lists):
+    """
+    rough number of bytes held by the arrays in a list of MultiBandObsLists
+
+    arrays shared between observations are counted once
+    """
+    seen = set()
+    nbytes = 0
+    for mb_obs_list in mb_obs_lists:
+        for obs_list in mb_obs_list:
+            for obs in obs_list:
+                nbytes += _get_arrays_nbytes(obs, seen)
+                if obs.has_psf():
+                    nbytes += _get_arrays_nbytes(obs.psf, seen)
+    return nbytes
+
+def _get_arrays_nbytes(obj, seen):
+    nbytes = 0
+    for val in obj.__dict__.itervalues():
+        if isinstance(val, numpy.ndarray) and id(val) not in seen:
+            seen.add(id(val))
+            nbytes += val.nbytes
+    return nbytes
+
+def _get_readonly(mb_obs_lists):
+    """
+    names of the read-only arrays of each observation, see obsbuffers
+    """
+    readonly = []
+    for obj in _iter_obs(mb_obs_lists):
+        names = [name for name,val in obj.__dict__.iteritems()
+                 if isinstance(val, numpy.ndarray) and not val.flags.writeable]
+        readonly.append(names)
+    return readonly
+
+def _set_readonly(mb_obs_lists, readonly):
+    """
+    mark the arrays read-only again after unpickling
+    """
+    for obj,names in zip(_iter_obs(mb_obs_lists),readonly):
+        for name in names:
+            obj.__dict__[name].flags.writeable = False
+
+def _iter_obs(mb_obs_lists):
+    for mb_obs_list in mb_obs_lists:
+        for obs_list in mb_obs_list:
+            for obs in obs_list:
+                yield obs
+                if obs.has_psf():
+                    yield obs.psf
+
+class Prefetcher(object):
+    """
+    get the FoFs at fofindexes with get_fof in a reader process
+
+    The reader is forked from the main process, as are the workers of the
+    pool, and calls reopen first, so it reads through its own file handles
+    and does not share fitsio with the main process, which keeps writing
+    checkpoints and outputs.  The obs lists are pickled back to the main
+    process; arrays shared between observations stay shared and read-only
+    arrays are marked read-only again.
+
+    At most nahead FoFs are held in the queue, and no new FoF is added
+    while the queued FoFs hold more than max_bytes, so the memory used
+    is bounded.  One FoF is always let through, however large.
+
+        pf = Prefetcher(imageio.get_fof, fofindexes, nahead=4, reopen=imageio.reopen)
+        for fofindex in fofindexes:
+            coadd_mb_obs_lists,mb_obs_lists = pf.get()
+
+    Errors in the reader process are raised again in get, as RuntimeError
+    with the traceback of the reader.  If finish is sent, the reader calls
+    it after the last FoF is read, e.g. to report on its caches.
+    """
+    def __init__(self, get_fof, fofindexes, nahead=4, max_bytes=None, reopen=None, finish=None):
+        assert nahead > 0,"prefetch must read at least one FoF ahead"
+
+        self.get_fof = get_fof
+        self.fofindexes = fofindexes
+        self.nahead = nahead
+        self.max_bytes = max_bytes
+        self.reopen = reopen
+        self.finish = finish
+
+        self._queue = multiprocessing.Queue()
+        self._cond = multiprocessing.Condition()
+        self._nqueued = multiprocessing.Value('l', 0, lock=False)
+        self._nbytes = multiprocessing.Value('d', 0.0, lock=False)
+        self._stop = multiprocessing.Event()
+        self._done = False
+
+        self._process = multiprocessing.Process(target=self._run)
+        self._process.daemon = True
+        self._process.start()
+
+    def _is_full(self, nbytes):
+        if self._nqueued.value == 0:
+            return False
+        if self._nqueued.value >= self.nahead:
+            return True
+        if self.max_bytes is not None and self._nbytes.value + nbytes > self.max_bytes:
+            return True
+        return False
+
+    def _run(self):
+        try:
+            if self.reopen is not None:
+                self.reopen()
+
+            for fofindex in self.fofindexes:
+                if self._stop.is_set():
+                    break
+
+                obs_lists = self.get_fof(fofindex)
+                nbytes = get_obs_nbytes(obs_lists[0]) + get_obs_nbytes(obs_lists[1])
+                readonly = (_get_readonly(obs_lists[0]),_get_readonly(obs_lists[1]))
+
+                with self._cond:
+                    while self._is_full(nbytes) and not self._stop.is_set():
+                        self._cond.wait(1.0)
+                    self._nqueued.value += 1
+                    self._nbytes.value += nbytes
+                self._queue.put(('fof',obs_lists,readonly,nbytes))
+
+            if self.finish is not None and not self._stop.is_set():
+                self.finish()
+        except:
+            self._queue.put(('error',traceback.format_exc()))
+        finally:
+            self._queue.put(('done',))
+
+    def get(self):
+        """
+        get the obs lists of the next FoF, waiting for it if needed
+        """
+        if self._done:
+            raise StopIteration
+
+        # wait with a timeout so the main process still gets signals
+        while True:
+            try:
+                item = self._queue.get(True, 1.0)
+                break
+            except Queue.Empty:
+                if not self._process.is_alive() and self._queue.empty():
+                    raise RuntimeError("prefetch reader process died")
+
+        if item[0] == 'error':
+            self._done = True
+            raise RuntimeError("error in prefetch reader:\n%s" % item[1])
+        elif item[0] == 'done':
+            self._done = True
+            raise StopIteration
+
+        obs_lists,readonly,nbytes = item[1:]
+        _set_readonly(obs_lists[0],readonly[0])
+        _set_readonly(obs_lists[1],readonly[1])
+
+        with self._cond:
+            self._nqueued.value -= 1
+            self._nbytes.value -= nbytes
+            self._cond.notify_all()
+
+        return obs_lists
+
+    def join(self):
+        """
+        wait for the reader to finish after the last FoF was got
+        """
+        while True:
+            try:
+                self.get()
+            except StopIteration:
+                break
+            raise RuntimeError("prefetch reader has FoFs left")
+
+    def stop(self):
+        """
+        stop reading and wait for the reader process to finish
+        """
+        self._stop.set()
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process.join()
@@ -0,0 +1,147 @@
+"""
+cache of reconstructed PSF images
+"""
+from __future__ import print_function
+from collections import OrderedDict
+import numpy
+
+class PSFImageCache(object):
+    """
+    PSF images keyed by band, file_id and position, with least recently used
+    eviction once the images hold more than max_bytes
+
+    If tol > 0, positions are rounded to a grid with spacing tol pixels, and
+    the PSF is made at the grid point, so all cutouts of an image within
+    about tol/2 of each other get the same PSF no matter the order they
+    are read in.  With tol = 0 only identical positions share a PSF, which
+    almost never happens for different objects, so the cache only pays off
+    with tol > 0.  Note tol > 0 is lossy: the PSF of a cutout is made at the
+    grid point, not at the cutout position.
+
+    Entries can be pinned, e.g. those made for the current FoF, so they are
+    not evicted before they are used.  Pinned entries can hold more than
+    max_bytes until they are unpinned.
+
+    Lookups are counted in nhit and nmiss.  Entries put with fill=True are
+    made ahead of their first lookup, which is counted in nfill rather than
+    as a hit; later lookups are hits.
+
+        key,row,col = cache.get_key(band,file_id,row,col)
+        entry = cache.get(key)
+        if entry is None:
+            entry = make the psf at row,col
+            cache.put(key,entry,nbytes)
+
+    parameters
+    ----------
+    tol: float, optional
+        grid spacing in pixels, default 0
+    max_bytes: int, optional
+        max bytes held by the cached images, default no limit
+    """
+    def __init__(self, tol=0.0, max_bytes=None):
+        self.tol = tol
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.nhit = 0
+        self.nmiss = 0
+        self.nfill = 0
+        self._entries = OrderedDict()
+        self._pinned = set()
+        self._filled = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def quantize(self, row, col):
+        """
+        positions on the grid, works for scalars or arrays
+        """
+        if self.tol > 0:
+            row = numpy.floor(numpy.asarray(row)/self.tol + 0.5)*self.tol
+            col = numpy.floor(numpy.asarray(col)/self.tol + 0.5)*self.tol
+        return row,col
+
+    def get_key(self, band, file_id, row, col):
+        """
+        get the key and grid position for a PSF
+        """
+        row,col = self.quantize(row, col)
+        row = float(row)
+        col = float(col)
+        return (int(band),int(file_id),row,col),row,col
+
+    def get(self, key):
+        """
+        get a cached entry, None if it is not there
+        """
+        if key not in self._entries:
+            self.nmiss += 1
+            return None
+
+        if key in self._filled:
+            self._filled.remove(key)
+            self.nfill += 1
+        else:
+            self.nhit += 1
+        entry,nbytes = self._entries.pop(key)
+
+        # most recently used goes at the end
+        self._entries[key] = (entry,nbytes)
+        return entry
+
+    def put(self, key, entry, nbytes, pin=False, fill=False):
+        """
+        add an entry holding nbytes, pinned if pin is True; send fill=True
+        for entries made ahead of their lookup
+        """
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+
+        self._entries[key] = (entry,nbytes)
+        self.nbytes += nbytes
+        if pin:
+            self._pinned.add(key)
+        if fill:
+            self._filled.add(key)
+        else:
+            self._filled.discard(key)
+
+        self._evict(keep=key)
+
+    def pin(self, key):
+        """
+        keep an entry until unpin_all is called
+        """
+        if key in self._entries:
+            self._pinned.add(key)
+
+    def unpin_all(self):
+        self._pinned.clear()
+        self._evict()
+
+    def _evict(self, keep=None):
+        """
+        drop least recently used entries that are not pinned until the
+        entries fit in max_bytes
+        """
+        if self.max_bytes is None or self.nbytes <= self.max_bytes:
+            return
+
+        for key in list(self._entries.keys()):
+            if self.nbytes <= self.max_bytes:
+                break
+            if key == keep or key in self._pinned:
+                continue
+            old_entry,old_nbytes = self._entries.pop(key)
+            self.nbytes -= old_nbytes
+            self._filled.discard(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._pinned.clear()
+        self._filled.clear()
+        self.nbytes = 0
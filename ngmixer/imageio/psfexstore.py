@@ -0,0 +1,174 @@
+"""
+PSFEx models of the images in a MEDS file, loaded when first used
+
+Which psfex files exist and can be read is checked once per tile and saved
+in a status file, so the chunks of a tile do not have to check them again.
+"""
+from __future__ import print_function
+import os
+import fcntl
+from collections import OrderedDict
+import numpy
+import fitsio
+
+from ..util import print_with_verbosity
+
+PSFEX_UNCHECKED = -1
+PSFEX_OK = 0
+PSFEX_MISSING = 1
+PSFEX_INVALID = 2
+
+def check_psfex(psfpath, check_valid=True):
+    """
+    status of a psfex file, PSFEX_OK, PSFEX_MISSING or PSFEX_INVALID
+
+    The file is only read if check_valid is True.
+    """
+    from psfex import PSFExError, PSFEx
+
+    if not os.path.exists(psfpath):
+        return PSFEX_MISSING
+
+    if check_valid:
+        try:
+            PSFEx(psfpath)
+        except PSFExError as err:
+            print("problem with psfex file: %s " % str(err))
+            return PSFEX_INVALID
+
+    return PSFEX_OK
+
+def get_psfex_status(psfpaths, check, status_file=None):
+    """
+    get the status of the psfex files
+
+    parameters
+    ----------
+    psfpaths: list of strings
+        the psfex files
+    check: bool array
+        which files to check, the others are PSFEX_UNCHECKED
+    status_file: string, optional
+        If sent, the status is read from this file when it holds the same
+        psfex files, and made and written there otherwise.  A lock file
+        makes sure only one job checks the files.
+
+    The files are always checked by reading them, so the status is the same
+    with or without a status file.
+    """
+    if status_file is None:
+        return _check_psfex_files(psfpaths, check)
+
+    status_dir = os.path.dirname(status_file)
+    if status_dir != '' and not os.path.exists(status_dir):
+        try:
+            os.makedirs(status_dir)
+        except OSError:
+            # made by another job
+            if not os.path.isdir(status_dir):
+                raise
+
+    with open(status_file+'.lock','w') as lock:
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        try:
+            status = _read_psfex_status(status_file, psfpaths, check)
+            if status is None:
+                status = _check_psfex_files(psfpaths, check)
+                _write_psfex_status(status_file, psfpaths, status)
+            else:
+                print("read psfex status: %s" % status_file)
+        finally:
+            fcntl.flock(lock,fcntl.LOCK_UN)
+
+    return status
+
+def _check_psfex_files(psfpaths, check):
+    status = numpy.zeros(len(psfpaths), dtype='i2')
+    status[:] = PSFEX_UNCHECKED
+    for i,psfpath in enumerate(psfpaths):
+        if check[i]:
+            status[i] = check_psfex(psfpath)
+    return status
+
+def _read_psfex_status(status_file, psfpaths, check):
+    """
+    read the status, None if the file is missing or for other psfex files
+    """
+    if not os.path.exists(status_file):
+        return None
+
+    data = fitsio.read(status_file)
+    if len(data) != len(psfpaths):
+        return None
+
+    for psfpath,saved in zip(psfpaths,data['psfpath']):
+        if psfpath != saved.strip():
+            return None
+
+    status = data['status'].astype('i2')
+    if numpy.any(check & (status == PSFEX_UNCHECKED)):
+        return None
+
+    return status
+
+def _write_psfex_status(status_file, psfpaths, status):
+    slen = max([len(psfpath) for psfpath in psfpaths] + [1])
+    data = numpy.zeros(len(psfpaths), dtype=[('psfpath','S%d' % slen),('status','i2')])
+    data['psfpath'] = psfpaths
+    data['status'] = status
+
+    tmp = '%s.tmp%d' % (status_file,os.getpid())
+    try:
+        fitsio.write(tmp, data, clobber=True)
+        os.rename(tmp, status_file)
+    except (IOError,OSError) as err:
+        print("could not write psfex status %s: %s" % (status_file,err))
+
+class PSFExStore(object):
+    """
+    the PSFEx objects for the images of a MEDS file, indexed by file_id
+
+    The PSFEx object for a file_id is read the first time it is used.  At
+    most max_models are kept, the least recently used are dropped.  Files
+    without PSFEX_OK status, or that fail to read, give None.
+
+        store = PSFExStore(psfpaths, status, max_models=100)
+        pex = store[file_id]
+    """
+    def __init__(self, psfpaths, status, max_models=None):
+        assert len(psfpaths) == len(status),"need a status for each psfex file"
+        self.psfpaths = psfpaths
+        self.status = status
+        self.max_models = max_models
+        self._models = OrderedDict()
+
+    def __len__(self):
+        return len(self.psfpaths)
+
+    def __getitem__(self, file_id):
+        if self.status[file_id] != PSFEX_OK:
+            return None
+
+        if file_id in self._models:
+            pex = self._models.pop(file_id)
+        else:
+            pex = self._load(file_id)
+            if self.max_models is not None:
+                while len(self._models) >= max(self.max_models,1):
+                    self._models.popitem(last=False)
+
+        # most recently used goes at the end
+        self._models[file_id] = pex
+        return pex
+
+    def _load(self, file_id):
+        from psfex import PSFExError, PSFEx
+
+        psfpath = self.psfpaths[file_id]
+        print_with_verbosity("loading: %s" % psfpath,verbosity=2)
+        try:
+            pex = PSFEx(psfpath)
+        except PSFExError as err:
+            print("problem with psfex file: %s " % str(err))
+            pex = None
+        return pex
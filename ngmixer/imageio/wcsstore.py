@@ -0,0 +1,183 @@
+"""
+WCS transforms of the images of a MEDS file, made when first used
+
+Reading the headers of all the images is the slow part, so the headers can
+be saved once per tile in a cache file, which the other chunks of the tile
+read instead.
+"""
+from __future__ import print_function
+import os
+import fcntl
+import numpy
+import fitsio
+
+from .manifest import pack_headers, unpack_headers, header_to_dict
+from ..util import print_with_verbosity
+
+# kinds of files the WCS headers are read from
+WCS_KINDS = {'image':"warning: missing coadd WCS from image: %s",
+             'scamp':"warning: missing scamp head: %s"}
+
+def read_wcs_header(path, kind):
+    """
+    read the WCS header of an image ('image', from the first extension) or a
+    scamp .head file ('scamp'), None if the file is missing
+    """
+    if kind not in WCS_KINDS:
+        raise ValueError("no WCS headers of kind %s" % kind)
+
+    fname = os.path.expandvars(path)
+    if not os.path.exists(fname):
+        print(WCS_KINDS[kind] % path)
+        return None
+
+    if kind == 'image':
+        return fitsio.read_header(fname, ext=1)
+    else:
+        return fitsio.read_scamp_head(fname)
+
+class WCSStore(object):
+    """
+    the WCS transforms of the images of a MEDS file, indexed by file_id
+
+    The header of a file_id is read, and its WCS made, the first time it is
+    used.  File ids whose header is missing give None.  Headers are kept as
+    plain dicts, see manifest.header_to_dict, whether they are read or
+    sent, so the WCS is made from the same keywords either way.
+
+        store = WCSStore(paths={file_id:(path,kind)})
+        wcs = store[file_id]
+
+    parameters
+    ----------
+    paths: dict, optional
+        file_id -> (path,kind) of the file to read the header from, see
+        read_wcs_header
+    headers: dict, optional
+        file_id -> header (or None) already read
+    """
+    def __init__(self, paths=None, headers=None):
+        if paths is None:
+            paths = {}
+        if headers is None:
+            headers = {}
+
+        self.paths = paths
+        self._headers = dict([(int(file_id),_to_dict(h)) for file_id,h in headers.iteritems()])
+        self._wcs = {}
+
+    def __len__(self):
+        return len(self.get_file_ids())
+
+    def __contains__(self, file_id):
+        return file_id in self.paths or file_id in self._headers
+
+    def __getitem__(self, file_id):
+        if file_id not in self._wcs:
+            from esutil.wcsutil import WCS
+
+            h = self.get_header(file_id)
+            if h is None:
+                self._wcs[file_id] = None
+            else:
+                self._wcs[file_id] = WCS(h)
+
+        return self._wcs[file_id]
+
+    def get_file_ids(self):
+        return sorted(set(self.paths) | set(self._headers))
+
+    def get_header(self, file_id):
+        """
+        get the header for a file_id, reading it if needed
+        """
+        if file_id not in self._headers:
+            if file_id not in self.paths:
+                raise KeyError("no WCS for file_id %s" % file_id)
+
+            path,kind = self.paths[file_id]
+            print_with_verbosity('reading WCS: %s' % path,verbosity=2)
+            self._headers[file_id] = _to_dict(read_wcs_header(path, kind))
+
+        return self._headers[file_id]
+
+    def get_headers(self):
+        """
+        get all headers, reading any not read yet
+        """
+        headers = {}
+        for file_id in self.get_file_ids():
+            headers[file_id] = self.get_header(file_id)
+        return headers
+
+def _to_dict(hdr):
+    if hdr is None:
+        return None
+    return header_to_dict(hdr)
+
+def get_wcs_store(paths, cache_file=None):
+    """
+    get a WCSStore for the files in paths, see WCSStore
+
+    If cache_file is sent, the headers are read from it when it holds the
+    same files.  Otherwise all headers are read and written there.  A lock
+    file makes sure only one job reads the headers.
+    """
+    if cache_file is None:
+        return WCSStore(paths=paths)
+
+    cache_dir = os.path.dirname(cache_file)
+    if cache_dir != '' and not os.path.exists(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # made by another job
+            if not os.path.isdir(cache_dir):
+                raise
+
+    with open(cache_file+'.lock','w') as lock:
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        try:
+            headers = _read_wcs_cache(cache_file, paths)
+            if headers is None:
+                headers = WCSStore(paths=paths).get_headers()
+                _write_wcs_cache(cache_file, paths, headers)
+            else:
+                print("read WCS cache: %s" % cache_file)
+        finally:
+            fcntl.flock(lock,fcntl.LOCK_UN)
+
+    return WCSStore(paths=paths, headers=headers)
+
+def _read_wcs_cache(cache_file, paths):
+    """
+    read the headers, None if the file is missing or for other files
+    """
+    if not os.path.exists(cache_file):
+        return None
+
+    data = fitsio.read(cache_file)
+    if len(data) != len(paths):
+        return None
+
+    for file_id,path in zip(data['file_id'],data['path']):
+        if file_id not in paths or paths[file_id][0] != path.strip():
+            return None
+
+    return unpack_headers(data)
+
+def _write_wcs_cache(cache_file, paths, headers):
+    hdata = pack_headers(headers)
+
+    slen = max([len(paths[file_id][0]) for file_id in hdata['file_id']] + [1])
+    data = numpy.zeros(len(hdata), dtype=hdata.dtype.descr + [('path','S%d' % slen)])
+    for name in hdata.dtype.names:
+        data[name] = hdata[name]
+    data['path'] = [paths[file_id][0] for file_id in hdata['file_id']]
+
+    tmp = '%s.tmp%d' % (cache_file,os.getpid())
+    try:
+        fitsio.write(tmp, data, clobber=True)
+        os.rename(tmp, cache_file)
+    except (IOError,OSError) as err:
+        print("could not write WCS cache %s: %s" % (cache_file,err))
@@ -1,4 +1,4 @@
 from .megamixer import NGMegaMixer, BaseNGMegaMixer
 from .slacmegamixer import SLACNGMegaMixer
-from . import concat, desconcat
+from . import concat, desconcat, costmodel
 from .concat_io import get_concat_class
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+predict the cost of fitting each FoF so tiles can be split into chunks
+with about equal run times
+
+The cost of an object is modeled as
+
+    cost = c0 + c1*npix + c2*npix*(nmem-1)
+
+where npix is the number of pixels in all of its cutouts (ncutout*box_size**2
+summed over bands) and nmem is the number of objects in its FoF.  The last
+term is the extra work of modeling the nbrs.  The cost of a FoF is the sum
+over its members.
+
+The coefficients can be calibrated from the timing columns of past runs on
+the same tile, otherwise the cost is just the number of pixels.
+"""
+from __future__ import print_function
+import numpy as np
+import fitsio
+
+_DEFAULT_COEFFS = np.array([0.0,1.0,1.0])
+
+def read_npix(meds_files):
+    """
+    read the ids of the objects and the number of pixels in their cutouts,
+    summed over bands
+    """
+    ids = None
+    npix = None
+    for fname in meds_files:
+        d = fitsio.read(fname,ext='object_data',columns=['id','box_size','ncutout'])
+        tnpix = d['ncutout'].astype('f8')*d['box_size'].astype('f8')**2
+        if npix is None:
+            ids = d['id']
+            npix = tnpix
+        else:
+            assert np.array_equal(ids,d['id']),"MEDS files %s has different ids!" % fname
+            npix += tnpix
+
+    return ids,npix
+
+def get_fof_index(nobj,fof_file=None):
+    """
+    index of the FoF of each object, in the order the FoFs are fit
+
+    The rows of the FoF file are in the same order as the objects in the
+    MEDS files and the FoFs are fit in order of fofid.
+    """
+    if fof_file is None:
+        return np.arange(nobj)
+
+    fofs = fitsio.read(fof_file,columns=['fofid'])
+    assert len(fofs) == nobj,"FoF file %s does not match the MEDS files!" % fof_file
+    fofids,fofind = np.unique(fofs['fofid'],return_inverse=True)
+    return fofind
+
+def get_features(npix,fofind):
+    """
+    the features of the cost model for each object
+    """
+    nmem = np.bincount(fofind)[fofind]
+    features = np.zeros((npix.size,_DEFAULT_COEFFS.size))
+    features[:,0] = 1.0
+    features[:,1] = npix
+    features[:,2] = npix*(nmem-1)
+    return features
+
+def get_fit_times(data):
+    """
+    the total fit time of each object in output data
+
+    uses the per stage timing columns if they are there, otherwise the
+    time_last_fit column
+    """
+    cols = [col for col in data.dtype.names
+            if col.startswith('time_') and col != 'time_last_fit']
+    if len(cols) > 0:
+        times = np.zeros(len(data))
+        for col in cols:
+            times += data[col]
+    else:
+        times = data['time_last_fit'].astype('f8')
+    return times
+
+def calibrate(ids,features,calib_files):
+    """
+    least squares fit of the cost model to the fit times in the output
+    files of past runs
+    """
+    rows = []
+    times = []
+    for fname in calib_files:
+        print('    reading timing: %s' % fname)
+        data = fitsio.read(fname,ext='model_fits')
+        tm = get_fit_times(data)
+
+        srt = np.argsort(ids)
+        ind = np.searchsorted(ids,data['id'],sorter=srt)
+        ind = np.clip(ind,0,ids.size-1)
+        ind = srt[ind]
+        w, = np.where((ids[ind] == data['id']) & (tm > 0))
+        rows.append(ind[w])
+        times.append(tm[w])
+
+    rows = np.concatenate(rows)
+    times = np.concatenate(times)
+    if rows.size < features.shape[1]:
+        print('    too few objects to calibrate the cost model, using defaults')
+        return _DEFAULT_COEFFS.copy()
+
+    coeffs = np.linalg.lstsq(features[rows],times,rcond=None)[0]
+
+    # the model only makes sense with costs that grow with size
+    coeffs = np.clip(coeffs,0.0,None)
+    if coeffs.sum() == 0:
+        return _DEFAULT_COEFFS.copy()
+
+    print('    cost model coeffs:',coeffs)
+    return coeffs
+
+class CostModel(object):
+    """
+    predict the cost of each FoF in a tile
+
+        cm = CostModel(meds_files,fof_file=fof_file,calib_files=calib_files)
+        costs = cm.get_fof_costs()
+    """
+    def __init__(self,meds_files,fof_file=None,calib_files=None):
+        ids,npix = read_npix(meds_files)
+        self.fofind = get_fof_index(ids.size,fof_file=fof_file)
+        self.features = get_features(npix,self.fofind)
+
+        if calib_files is not None and len(calib_files) > 0:
+            self.coeffs = calibrate(ids,self.features,calib_files)
+        else:
+            self.coeffs = _DEFAULT_COEFFS.copy()
+
+    def get_fof_costs(self):
+        """
+        predicted cost of each FoF, in the order the FoFs are fit
+        """
+        obj_costs = self.features.dot(self.coeffs)
+        return np.bincount(self.fofind,weights=obj_costs)
+
+def get_cost_ranges(costs,nchunks):
+    """
+    split the FoFs into contiguous ranges with about equal total cost
+
+    FoFs that cost more than the target of a chunk get a chunk of their
+    own, so there can be a few more than nchunks ranges.
+
+    returns
+    -------
+    fof_ranges: list of [start,stop], inclusive
+    range_costs: the total cost of each range
+    """
+    target = costs.sum()/max(nchunks,1)
+
+    fof_ranges = []
+    range_costs = []
+
+    start = 0
+    curr = 0.0
+    for i,cost in enumerate(costs):
+        # close the current chunk if this FoF would push it over the
+        # target by more than it would leave it under
+        if i > start and (cost >= target or curr + 0.5*cost > target):
+            fof_ranges.append([start,i-1])
+            range_costs.append(curr)
+            start = i
+            curr = 0.0
+
+        curr += cost
+
+    if start < len(costs):
+        fof_ranges.append([start,len(costs)-1])
+        range_costs.append(curr)
+
+    return fof_ranges,range_costs
@@ -119,7 +119,29 @@ class BaseNGMegaMixer(dict):
     def get_chunk_output_basename(self,files,chunk,rng):
         return '%s-%s-%d-%d' % (files['coadd_tile'],self['run'],rng[0],rng[1])
     
+    def get_fof_ranges_file(self,files):
+        return os.path.join(files['work_output_dir'],'fof_ranges.fits')
+
     def get_fof_ranges(self,files):
+        """
+        split the FoFs of a tile into chunks
+
+        If chunk_by_cost is set in the config, the chunks have about equal
+        predicted run time, see costmodel.py.  The cost model can be
+        calibrated with the outputs of past runs in cost_calib_files.  These
+        ranges are saved at setup so later commands use the same chunks.
+
+        Otherwise each chunk has num_fofs_per_chunk FoFs.
+        """
+        self.fof_range_costs = None
+
+        if self.get('chunk_by_cost',False):
+            rfile = self.get_fof_ranges_file(files)
+            if os.path.exists(rfile):
+                rdata = fitsio.read(rfile)
+                self.fof_range_costs = list(rdata['cost'])
+                return [[sr,sp] for sr,sp in zip(rdata['start'],rdata['stop'])]
+
         if self['model_nbrs']:
             fofs = fitsio.read(files['fof_file'])
             num_fofs = len(np.unique(fofs['fofid']))
@@ -132,6 +154,20 @@ class BaseNGMegaMixer(dict):
         if nchunks*self['num_fofs_per_chunk'] < num_fofs:
             nchunks += 1
 
+        if self.get('chunk_by_cost',False):
+            from .costmodel import CostModel, get_cost_ranges
+
+            print("predicting FoF costs")
+            if self['model_nbrs']:
+                fof_file = files['fof_file']
+            else:
+                fof_file = None
+            cm = CostModel(files['meds_files'],
+                           fof_file=fof_file,
+                           calib_files=self.get('cost_calib_files',None))
+            fof_ranges,self.fof_range_costs = get_cost_ranges(cm.get_fof_costs(),nchunks)
+            return fof_ranges
+
         fof_ranges = []
         for chunk in xrange(nchunks):
             sr = chunk*self['num_fofs_per_chunk']
@@ -142,6 +178,58 @@ class BaseNGMegaMixer(dict):
 
         return fof_ranges
 
+    def write_fof_ranges(self,files,fof_ranges):
+        """
+        save the cost based FoF ranges of a tile
+        """
+        rdata = np.zeros(len(fof_ranges),dtype=[('start','i8'),('stop','i8'),('cost','f8')])
+        rdata['start'] = [rng[0] for rng in fof_ranges]
+        rdata['stop'] = [rng[1] for rng in fof_ranges]
+        rdata['cost'] = self.fof_range_costs
+        fitsio.write(self.get_fof_ranges_file(files),rdata,clobber=True)
+
+    def get_manifest_file(self,files):
+        return os.path.join(files['work_output_dir'],
+                            '%s-%s-manifest.fits' % (files['coadd_tile'],self['run']))
+
+    def write_tile_manifest(self,files):
+        """
+        make the imageio for the full tile and save its startup state, so
+        the chunks can read it instead of making it again
+
+        The tile work dir is used as the tile_cache_dir, so the psfex files
+        are also checked for validity.
+        """
+        from ..imageio import get_imageio_class
+
+        conf = {}
+        conf.update(self.ngmix_conf)
+        conf['work_dir'] = files['work_output_dir']
+        conf['tile_cache_dir'] = conf.get('tile_cache_dir',files['work_output_dir'])
+        conf['tile_manifest'] = None
+
+        fof_file = None
+        extra_data = {}
+        if self['model_nbrs']:
+            fof_file = files['fof_file']
+            extra_data['nbrs'] = fitsio.read(files['nbrs_file'])
+
+        imageio_class = get_imageio_class(conf['imageio_type'])
+        imageio = imageio_class(conf,
+                                files['meds_files'],
+                                fof_file=fof_file,
+                                extra_data=extra_data)
+        imageio.write_manifest(self.get_manifest_file(files))
+
+    def get_chunk_order(self,fof_ranges):
+        """
+        order in which to run the chunks, most expensive first when the
+        costs are known
+        """
+        if getattr(self,'fof_range_costs',None) is None:
+            return range(len(fof_ranges))
+        return list(np.argsort(self.fof_range_costs,kind='mergesort')[::-1])
+
     def make_output_dirs(self,files,fof_ranges):
         """
         make output dirs
@@ -187,6 +275,9 @@ cmd="`which {cmd}` \
     {nbrs_opt} \
     {flags_opt} \
     {seed_opt} \
+    {nworkers_opt} \
+    {profile_opt} \
+    {manifest_opt} \
     $config $ofile $meds"
 
 echo $cmd
@@ -227,6 +318,21 @@ python -u $cmd &> $lfile
         else:
             args['seed_opt'] = ''
 
+        if 'nworkers' in self:
+            args['nworkers_opt'] = '--nworkers=%d' % self['nworkers']
+        else:
+            args['nworkers_opt'] = ''
+
+        if self.get('sample_profile',False):
+            args['profile_opt'] = '--sample-profile'
+        else:
+            args['profile_opt'] = ''
+
+        if self.get('tile_manifest',False):
+            args['manifest_opt'] = '--manifest=%s' % self.get_manifest_file(files)
+        else:
+            args['manifest_opt'] = ''
+
         scr = fmt.format(**args)
 
         scr_name = os.path.join(self.get_chunk_output_dir(files,i,rng),'runchunk.sh')
@@ -252,13 +358,18 @@ python -u $cmd &> $lfile
         files,fof_ranges = self.get_files_fof_ranges(coadd_tile)
         
         self.make_output_dirs(files,fof_ranges)
+        if self.get('chunk_by_cost',False):
+            self.write_fof_ranges(files,fof_ranges)
+        if self.get('tile_manifest',False):
+            self.write_tile_manifest(files)
         self.make_scripts(files,fof_ranges)
 
     def run_coadd_tile(self,coadd_tile):
         print("running tile '%s'" % coadd_tile)
         files,fof_ranges = self.get_files_fof_ranges(coadd_tile)
 
-        for chunk,rng in enumerate(fof_ranges):
+        for chunk in self.get_chunk_order(fof_ranges):
+            rng = fof_ranges[chunk]
             dr = self.get_chunk_output_dir(files,chunk,rng)
             base = self.get_chunk_output_basename(files,self['run'],rng)
             fname = os.path.join(dr,base+'.fits')
@@ -277,6 +388,10 @@ python -u $cmd &> $lfile
             if os.path.exists(fname):
                 os.remove(fname)
 
+            fname = os.path.join(dr,base+'-profile.txt')
+            if os.path.exists(fname):
+                os.remove(fname)
+
             fname = os.path.join(dr,base+'.fits')
             if os.path.exists(fname):
                 os.remove(fname)
@@ -385,6 +500,29 @@ python -u $cmd &> $lfile
         except:
             print("failed to link tile '%s'" % coadd_tile)
         
+    def profile_coadd_tile(self,coadd_tile):
+        """
+        merge the sampling profiles of all chunks into one folded profile
+        for the tile, returns the merged counts
+        """
+        from ..profiling import merge_folded
+
+        print("merging profiles for tile '%s'" % coadd_tile)
+        files,fof_ranges = self.get_files_fof_ranges(coadd_tile)
+
+        plist = []
+        for chunk,rng in enumerate(fof_ranges):
+            dr = self.get_chunk_output_dir(files,chunk,rng)
+            base = self.get_chunk_output_basename(files,self['run'],rng)
+            plist.append(os.path.join(dr,base+'-profile.txt'))
+
+        ofile = os.path.join(files['main_output_dir'],
+                             '%s-%s-profile.txt' % (files['coadd_tile'],self['run']))
+        if not os.path.exists(files['main_output_dir']):
+            os.makedirs(files['main_output_dir'])
+
+        return merge_folded(plist,output_file=ofile)
+
     def get_tmp_dir(self):
         return '`mktemp -d /tmp/XXXXXXXXXX`'
 
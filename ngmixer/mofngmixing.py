@@ -12,7 +12,7 @@ from . import imageio
 from . import fitting
 from . import files
 from .ngmixing import NGMixer
-from .defaults import DEFVAL,_CHECKPOINTS_DEFAULT_MINUTES
+from .defaults import DEFVAL
 from .defaults import NO_ATTEMPT,NO_CUTOUTS,BOX_SIZE_TOO_BIG,IMAGE_FLAGS
 from .defaults import MOF_SKIPPED_IN_CONV_CHECK, \
     MOF_NOT_CONVERGED, \
@@ -219,159 +219,138 @@ class MOFNGMixer(NGMixer):
             self.curr_data[tag][fofind] = self.default_data[tag]
         self.curr_data['fofind'][fofind] = fofind
 
-    def do_fits(self):
+    def fit_fof(self,coadd_mb_obs_lists,mb_obs_lists):
         """
-        Fit all objects in our list
+        Fit all objects in a FoF, modeling the nbrs
         """
+        foflen = len(mb_obs_lists)
+        print('    num in fof: %d' % foflen)
 
-        self.done = False
+        self._seed_fof(mb_obs_lists)
 
-        print('doing fits')
-
-        t0=time.time()
         num = 0
-        numfof = 0
         numtot = self.imageio.get_num_fofs()
 
-        print('fof index: %d:%d' % (self.curr_fofindex+1-self.start_fofindex,numtot))
-        for coadd_mb_obs_lists,mb_obs_lists in self.imageio:
-            numfof += 1
-
-            foflen = len(mb_obs_lists)
-            print('    num in fof: %d' % foflen)
-
-            # get data to fill
-            self.curr_data = self._make_struct(num=foflen)
-            for i in xrange(foflen):
-                self._set_default_data_for_fofind(i)
-                
-            #####################################################################
-            # fit the fof once with no nbrs
-            # sort by stamp size
-            # set weight to uberseg if more than one thing in fof
-            for coadd_mb_obs_list,mb_obs_list in zip(coadd_mb_obs_lists,mb_obs_lists):
-                for obs_list in mb_obs_list:
-                    for obs in obs_list:
-                        if obs.meta['flags'] == 0:
-                            if foflen > 1:
-                                obs.weight = getattr(obs,'weight_us',obs.weight)
-                            else:
-                                obs.weight = getattr(obs,'weight_raw',obs.weight)
-                            obs.weight_orig = obs.weight.copy()
-                for obs_list in coadd_mb_obs_list:
-                    for obs in obs_list:
-                        if obs.meta['flags'] == 0:
-                            if foflen > 1:
-                                obs.weight = getattr(obs,'weight_us',obs.weight)
-                            else:
-                                obs.weight = getattr(obs,'weight_raw',obs.weight)
-                            obs.weight_orig = obs.weight.copy()
-
-            bs = []
-            for coadd_mb_obs_list,mb_obs_list in zip(coadd_mb_obs_lists,mb_obs_lists):
-                box_size = self._get_box_size(mb_obs_list)
-                if box_size < 0:
-                    box_size = self._get_box_size(coadd_mb_obs_list)
-                bs.append(box_size)
-            bs = numpy.array(bs)
-            q = numpy.argsort(bs)
-            q = q[::-1] # sort to fit biggest to smallest
-            for i in q:
-                self.curr_data_index = i
-                coadd_mb_obs_list = coadd_mb_obs_lists[i]
-                mb_obs_list = mb_obs_lists[i]
-                if foflen > 1:
-                    print('  fof obj: %d:%d' % (self.curr_data_index+1,foflen))
-                print('    id: %d' % mb_obs_list.meta['id'])
-
-                num += 1
-                ti = time.time()
-                self.fit_obj(coadd_mb_obs_list,mb_obs_list,nbrs_fit_data=None)
-                ti = time.time()-ti
-                print('    time: %f' % ti)
-
-
-            #####################################################################
-            # now fit again with nbrs if needed
+        # get data to fill
+        self.curr_data = self.data.append(foflen)
+        self.curr_data[:] = self._make_struct()
+        for i in xrange(foflen):
+            self._set_default_data_for_fofind(i)
+
+        #####################################################################
+        # fit the fof once with no nbrs
+        # sort by stamp size
+        # set weight to uberseg if more than one thing in fof
+        # the weight maps are shared and read-only, so switching is just
+        # pointing at another one, see obsbuffers
+        for coadd_mb_obs_list,mb_obs_list in zip(coadd_mb_obs_lists,mb_obs_lists):
+            for obs_list in mb_obs_list:
+                for obs in obs_list:
+                    if obs.meta['flags'] == 0:
+                        if foflen > 1:
+                            obs.weight = getattr(obs,'weight_us',obs.weight)
+                        else:
+                            obs.weight = getattr(obs,'weight_raw',obs.weight)
+                        obs.weight_orig = obs.weight
+            for obs_list in coadd_mb_obs_list:
+                for obs in obs_list:
+                    if obs.meta['flags'] == 0:
+                        if foflen > 1:
+                            obs.weight = getattr(obs,'weight_us',obs.weight)
+                        else:
+                            obs.weight = getattr(obs,'weight_raw',obs.weight)
+                        obs.weight_orig = obs.weight
+
+        bs = []
+        for coadd_mb_obs_list,mb_obs_list in zip(coadd_mb_obs_lists,mb_obs_lists):
+            box_size = self._get_box_size(mb_obs_list)
+            if box_size < 0:
+                box_size = self._get_box_size(coadd_mb_obs_list)
+            bs.append(box_size)
+        bs = numpy.array(bs)
+        q = numpy.argsort(bs)
+        q = q[::-1] # sort to fit biggest to smallest
+        for i in q:
+            self.curr_data_index = i
+            coadd_mb_obs_list = coadd_mb_obs_lists[i]
+            mb_obs_list = mb_obs_lists[i]
             if foflen > 1:
+                print('  fof obj: %d:%d' % (self.curr_data_index+1,foflen))
+            print('    id: %d' % mb_obs_list.meta['id'])
+
+            num += 1
+            ti = time.time()
+            self.fit_obj(coadd_mb_obs_list,mb_obs_list,nbrs_fit_data=None)
+            ti = time.time()-ti
+            print('    time: %f' % ti)
+
+
+        #####################################################################
+        # now fit again with nbrs if needed
+        if foflen > 1:
+
+            if self['mof']['write_convergence_data']:
+                self._write_convergence_data(mb_obs_lists,self.curr_data, \
+                                             self['mof']['convergence_model'],init=True)
+
+            converged = False
+            for itr in xrange(self['mof']['max_itr']):
+                print('itr %d - fof index %d:%d ' % (itr+1,\
+                                                     self.curr_fofindex+1-self.start_fofindex,\
+                                                     numtot))
+
+                # switch back to non-uberseg weights
+                if itr >= self['mof']['min_useg_itr']:
+                    for coadd_mb_obs_list,mb_obs_list in zip(coadd_mb_obs_lists,mb_obs_lists):
+                        for obs_list in mb_obs_list:
+                            for obs in obs_list:
+                                if obs.meta['flags'] == 0:
+                                    obs.weight = getattr(obs,'weight_raw',obs.weight)
+                                    obs.weight_orig = obs.weight
+                        for obs_list in coadd_mb_obs_list:
+                            for obs in obs_list:
+                                if obs.meta['flags'] == 0:
+                                    obs.weight = getattr(obs,'weight_raw',obs.weight)
+                                    obs.weight_orig = obs.weight
+
+                # data
+                self.prev_data = self.curr_data.copy()
+
+                # fitting
+                for i in self.rng.choice(foflen,size=foflen,replace=False):
+                    self.curr_data_index = i
+
+                    coadd_mb_obs_list = coadd_mb_obs_lists[i]
+                    mb_obs_list = mb_obs_lists[i]
+                    print('  fof obj: %d:%d - itr %d' % (self.curr_data_index+1,foflen,itr+1))
+                    print('    id: %d' % mb_obs_list.meta['id'])
+
+                    num += 1
+                    ti = time.time()
+                    self.fit_obj(coadd_mb_obs_list,mb_obs_list,nbrs_fit_data=self.curr_data)
+                    ti = time.time()-ti
+                    print('    time: %f' % ti)
 
                 if self['mof']['write_convergence_data']:
                     self._write_convergence_data(mb_obs_lists,self.curr_data, \
-                                                 self['mof']['convergence_model'],init=True)
-
-                converged = False
-                for itr in xrange(self['mof']['max_itr']):
-                    print('itr %d - fof index %d:%d ' % (itr+1,\
-                                                         self.curr_fofindex+1-self.start_fofindex,\
-                                                         numtot))
-
-                    # switch back to non-uberseg weights
-                    if itr >= self['mof']['min_useg_itr']:
-                        for coadd_mb_obs_list,mb_obs_list in zip(coadd_mb_obs_lists,mb_obs_lists):
-                            for obs_list in mb_obs_list:
-                                for obs in obs_list:
-                                    if obs.meta['flags'] == 0:
-                                        obs.weight = getattr(obs,'weight_raw',obs.weight)
-                                        obs.weight_orig = obs.weight.copy()
-                            for obs_list in coadd_mb_obs_list:
-                                for obs in obs_list:
-                                    if obs.meta['flags'] == 0:
-                                        obs.weight = getattr(obs,'weight_raw',obs.weight)
-                                        obs.weight_orig = obs.weight.copy()
-
-                    # data
-                    self.prev_data = self.curr_data.copy()
-                    
-                    # fitting
-                    for i in numpy.random.choice(foflen,size=foflen,replace=False):
-                        self.curr_data_index = i
-                        
-                        coadd_mb_obs_list = coadd_mb_obs_lists[i]
-                        mb_obs_list = mb_obs_lists[i]
-                        print('  fof obj: %d:%d - itr %d' % (self.curr_data_index+1,foflen,itr+1))
-                        print('    id: %d' % mb_obs_list.meta['id'])
-
-                        num += 1
-                        ti = time.time()
-                        self.fit_obj(coadd_mb_obs_list,mb_obs_list,nbrs_fit_data=self.curr_data)
-                        ti = time.time()-ti
-                        print('    time: %f' % ti)
-
-                    if self['mof']['write_convergence_data']:
-                        self._write_convergence_data(mb_obs_lists,self.curr_data, \
-                                                     self['mof']['convergence_model'],init=False)
-
-                    print('  convergence itr %d:' % (itr+1))
-                    if self._check_convergence(foflen,itr,coadd_mb_obs_lists,mb_obs_lists) and itr >= self['mof']['min_itr']:
-                        converged = True
-                        break
-
-                print('  convergence fof index: %d' % (self.curr_fofindex+1-self.start_fofindex))
-                print('    converged: %s' % str(converged))
-                print('    num itr: %d' % (itr+1))
-            else:
-                # one object in fof, so set mof flags
-                models_to_check,pars_models_to_check,cov_models_to_check,npars = self._get_models_to_check()
-                for model in models_to_check:
-                    n = Namer(model)
-                    self.curr_data[n('mof_flags')] = 0
-
-            # append data and incr.
-            self.data.extend(list(self.curr_data))
-            self.curr_fofindex += 1
-
-            tm=time.time()-t0
-            self._try_checkpoint(tm)
+                                                 self['mof']['convergence_model'],init=False)
 
-            if self.curr_fofindex-self.start_fofindex < numtot:
-                print('fof index: %d:%d' % (self.curr_fofindex+1-self.start_fofindex,numtot))
+                print('  convergence itr %d:' % (itr+1))
+                if self._check_convergence(foflen,itr,coadd_mb_obs_lists,mb_obs_lists) and itr >= self['mof']['min_itr']:
+                    converged = True
+                    break
 
-        tm=time.time()-t0
-        print("time: %f" % tm)
-        print("time per fit: %f" % (tm/num))
-        print("time per fof: %f" % (tm/numfof))
+            print('  convergence fof index: %d' % (self.curr_fofindex+1-self.start_fofindex))
+            print('    converged: %s' % str(converged))
+            print('    num itr: %d' % (itr+1))
+        else:
+            # one object in fof, so set mof flags
+            models_to_check,pars_models_to_check,cov_models_to_check,npars = self._get_models_to_check()
+            for model in models_to_check:
+                n = Namer(model)
+                self.curr_data[n('mof_flags')] = 0
 
-        self.done = True
+        return num
 
     def _write_convergence_data(self,mb_obs_lists,curr_data,model,init=False):
         for i in xrange(len(mb_obs_lists)):
@@ -13,6 +13,212 @@ def get_dummy_fofs(numbers):
     fofs['number'][:] = numbers[:] #subscript should make a copy
     return fofs
 
+class FoFIndex(object):
+    """
+    Index of the members of each FoF, stored as offsets and members arrays
+    (compressed sparse rows).
+
+    The mindexes of the members of FoF i are
+
+        members[offsets[i]:offsets[i+1]]
+
+    in increasing order.  The FoFs are in order of fofid.
+
+    Build one from FoF data with FoFIndex.from_fof_data, or use
+    get_fof_index to also cache it on disk.
+    """
+    def __init__(self, fofids, offsets, members, check_members=True):
+        self.fofids = fofids
+        self.offsets = offsets
+        self.members = members
+        self._check(check_members=check_members)
+
+    @classmethod
+    def from_fof_data(cls, fof_data):
+        """
+        build the index from an array with a fofid column, one row per mindex
+        """
+        fofid = fof_data['fofid']
+
+        # stable sort so the members of a FoF stay in mindex order
+        members = numpy.argsort(fofid, kind='mergesort')
+        sorted_fofid = fofid[members]
+
+        fofids = numpy.unique(sorted_fofid)
+        offsets = numpy.zeros(len(fofids)+1, dtype='i8')
+        offsets[:-1] = numpy.searchsorted(sorted_fofid, fofids, side='left')
+        offsets[-1] = len(members)
+
+        index = cls(fofids, offsets, members.astype('i8'))
+        assert numpy.array_equal(fofid[index.members],
+                                 numpy.repeat(index.fofids,index.get_sizes())),"FoF index does not match the FoF data!"
+        return index
+
+    def _check(self, check_members=True):
+        nobj = len(self.members)
+        assert len(self.offsets) == len(self.fofids)+1,"FoF index has %d offsets for %d FoFs!" % (len(self.offsets),len(self.fofids))
+        assert self.offsets[0] == 0 and self.offsets[-1] == nobj,"FoF index offsets do not cover all objects!"
+        assert numpy.all(numpy.diff(self.offsets) > 0),"Found zero length FoF!"
+        assert numpy.all(numpy.diff(self.fofids) > 0),"FoF index fofids are not sorted and unique!"
+        if check_members:
+            assert numpy.array_equal(numpy.sort(self.members),numpy.arange(nobj)),"FoF index does not hold every object once!"
+
+    def __len__(self):
+        return len(self.fofids)
+
+    def get_members(self, fofindex):
+        """
+        mindexes of the members of the FoF at fofindex
+        """
+        return self.members[self.offsets[fofindex]:self.offsets[fofindex+1]]
+
+    def get_sub_index(self, start, end):
+        """
+        index of the FoFs with fofid in [start,end]
+
+        The members are still the mindexes in the full files, so a range of
+        FoFs can be read from them without extracting it.
+        """
+        i0 = numpy.searchsorted(self.fofids, start, side='left')
+        i1 = numpy.searchsorted(self.fofids, end, side='right')
+        offsets = self.offsets[i0:i1+1] - self.offsets[i0]
+        members = self.members[self.offsets[i0]:self.offsets[i1]]
+        return FoFIndex(self.fofids[i0:i1], offsets, members, check_members=False)
+
+    def get_sizes(self):
+        """
+        number of members of each FoF
+        """
+        return numpy.diff(self.offsets)
+
+    def write(self, fname, fof_file=None):
+        """
+        write the index to a .npz file
+
+        If fof_file is sent, its size and modification time are recorded so
+        read can tell if the index is stale.  The file is written to a
+        temporary name and moved into place.
+        """
+        size,mtime = _get_size_mtime(fof_file)
+        tmp = '%s.tmp%d' % (fname,os.getpid())
+        with open(tmp,'wb') as fp:
+            numpy.savez(fp,
+                        fofids=self.fofids,
+                        offsets=self.offsets,
+                        members=self.members,
+                        fof_size=size,
+                        fof_mtime=mtime)
+        os.rename(tmp,fname)
+
+    @classmethod
+    def read(cls, fname, fof_file=None):
+        """
+        read an index written with write
+
+        returns None if fof_file is sent and changed since the index was made
+        """
+        with numpy.load(fname) as d:
+            if fof_file is not None:
+                size,mtime = _get_size_mtime(fof_file)
+                if d['fof_size'] != size or d['fof_mtime'] != mtime:
+                    return None
+            return cls(d['fofids'], d['offsets'], d['members'])
+
+def _get_size_mtime(fname):
+    if fname is None:
+        return -1,-1.0
+    stat = os.stat(fname)
+    return stat.st_size,stat.st_mtime
+
+def get_fof_index_file(fof_file):
+    """
+    name of the cached index of a FoF file, next to it
+    """
+    bname = fof_file.replace('.fits.fz','').replace('.fits','')
+    return bname + '-index.npz'
+
+def get_fof_index(fof_data, fof_file=None, cache=False):
+    """
+    get the FoFIndex for fof_data
+
+    If cache is True and fof_file is sent, the index is read from next to
+    the FoF file when it is up to date, and written there otherwise, so
+    later jobs on the same file can skip building it.  Failures to read or
+    write the cache are not fatal.
+    """
+    if not cache or fof_file is None:
+        return FoFIndex.from_fof_data(fof_data)
+
+    index_file = get_fof_index_file(fof_file)
+
+    index = None
+    if os.path.exists(index_file):
+        try:
+            index = FoFIndex.read(index_file, fof_file=fof_file)
+        except (IOError,OSError,KeyError,ValueError,AssertionError) as err:
+            print 'could not read FoF index %s: %s' % (index_file,err)
+            index = None
+
+        if index is not None and len(index.members) != len(fof_data):
+            index = None
+
+    if index is None:
+        index = FoFIndex.from_fof_data(fof_data)
+        try:
+            index.write(index_file, fof_file=fof_file)
+        except (IOError,OSError) as err:
+            print 'could not write FoF index %s: %s' % (index_file,err)
+    else:
+        print 'read FoF index:',index_file
+
+    return index
+
+class NbrsIndex(object):
+    """
+    Index of the nbrs of each object in a nbrs table, stored as offsets
+    and nbr numbers arrays (compressed sparse rows).
+
+    Rows with nbr_number of -1 are skipped.  The nbrs of an object keep
+    the order of their rows in the table.
+
+        index = NbrsIndex.from_nbrs_data(nbrs_data)
+        nbr_numbers = index.get_nbrs(number)
+    """
+    def __init__(self, numbers, offsets, nbr_numbers):
+        self.numbers = numbers
+        self.offsets = offsets
+        self.nbr_numbers = nbr_numbers
+        assert len(self.offsets) == len(self.numbers)+1,"nbrs index has %d offsets for %d objects!" % (len(self.offsets),len(self.numbers))
+        assert self.offsets[-1] == len(self.nbr_numbers),"nbrs index offsets do not cover all nbrs!"
+
+    @classmethod
+    def from_nbrs_data(cls, nbrs_data):
+        """
+        build the index from a nbrs table with number and nbr_number columns
+        """
+        keep, = numpy.where(nbrs_data['nbr_number'] != -1)
+        number = nbrs_data['number'][keep]
+
+        # stable sort so the nbrs stay in table order
+        srt = numpy.argsort(number, kind='mergesort')
+        number = number[srt]
+
+        numbers = numpy.unique(number)
+        offsets = numpy.zeros(len(numbers)+1, dtype='i8')
+        offsets[:-1] = numpy.searchsorted(number, numbers, side='left')
+        offsets[-1] = len(number)
+
+        return cls(numbers, offsets, nbrs_data['nbr_number'][keep[srt]])
+
+    def get_nbrs(self, number):
+        """
+        numbers of the nbrs of the object with the given number
+        """
+        i = numpy.searchsorted(self.numbers, number)
+        if i == len(self.numbers) or self.numbers[i] != number:
+            return self.nbr_numbers[0:0]
+        return self.nbr_numbers[self.offsets[i]:self.offsets[i+1]]
+
 class MedsNbrs(object):
     """
     Gets nbrs of any postage stamp in the MEDS.
@@ -266,14 +472,18 @@ class NbrsFoF(object):
 class NbrsFoFExtractor(object):
     """
     Class to extract subet set of FoF file and destroy on exit if wanted.
+
+    If sub_file is None, nothing is written and the extracted rows are only
+    kept in memory, as .data.  The numbers of the objects are in .numbers.
     """
 
-    def __init__(self, fof_file, start, end, sub_file, cleanup=False):
+    def __init__(self, fof_file, start, end, sub_file=None, cleanup=False, index_cache=False):
         self.fof_file = fof_file
         self.start = start
         self.end = end
         self.sub_file = sub_file
         self.cleanup = cleanup
+        self.index_cache = index_cache
         self._check_inputs()
 
         self._extract()
@@ -288,18 +498,15 @@ class NbrsFoFExtractor(object):
         self.close()
 
     def close(self):
-        if self.cleanup:
+        if self.cleanup and self.sub_file is not None:
             if os.path.exists(self.sub_file):
                 print 'removing sub file:',self.sub_file
                 os.remove(self.sub_file)
 
     def _get_inds(self, data):
-        inds = []
-        for fofid in range(self.start,self.end+1):
-            q, = numpy.where(data['fofid'] == fofid)
-            if len(q) > 0:
-                inds.extend(list(q))
-        inds = numpy.array(inds,dtype=int)
+        # rows of the FoFs in the range from the FoF index, no scan per fofid
+        index = get_fof_index(data, fof_file=self.fof_file, cache=self.index_cache)
+        inds = index.get_sub_index(self.start,self.end).members
         #always write this sorted!
         q = numpy.argsort(data['number'][inds])
         inds = inds[q]
@@ -307,14 +514,14 @@ class NbrsFoFExtractor(object):
         return inds
 
     def _extract(self):
+        old_data = fitsio.read(self.fof_file)
+        inds = self._get_inds(old_data)
+        self.data = old_data[inds]
 
-        with fitsio.FITS(self.fof_file) as infits:
+        if self.sub_file is not None:
             print 'opening sub file:',self.sub_file
             with fitsio.FITS(self.sub_file,'rw',clobber=True) as outfits:
-                old_data = infits[1][:]
-                inds = self._get_inds(old_data)
-                obj_data = old_data[inds]
-                outfits.write(obj_data)
+                outfits.write(self.data)
 
     def _check_inputs(self):
         if self.fof_file==self.sub_file:
@@ -10,9 +10,61 @@ import fitsio
 from . import imageio
 from . import fitting
 from . import files
-from .defaults import DEFVAL,_CHECKPOINTS_DEFAULT_MINUTES
+from .timing import TIMER, OBJECT_STAGES
+from .defaults import DEFVAL,_CHECKPOINT_DEFAULT_SECONDS
 from .defaults import NO_ATTEMPT,NO_CUTOUTS,BOX_SIZE_TOO_BIG,IMAGE_FLAGS,BAD_OBJ,UTTER_FAILURE
-from .util import UtterFailure, seed_numpy
+from .util import UtterFailure, seed_numpy, get_fof_rng, ResultStore, copy_fields
+
+# the mixer used by a worker process, see _init_fof_worker
+_WORKER_MIXER = None
+
+def _init_fof_worker(mixer):
+    """
+    initialize a worker process to fit whole FoFs
+
+    the mixer is inherited from the parent when the worker is forked, so
+    it is never pickled
+    """
+    global _WORKER_MIXER
+    mixer._setup_worker()
+    _WORKER_MIXER = mixer
+
+    # the worker reads its FoFs, so it reports on its caches when it exits
+    import multiprocessing.util
+    multiprocessing.util.Finalize(None, mixer.imageio.print_cache_stats, exitpriority=10)
+
+    # interval timers are not inherited by forked processes
+    if mixer.profiler is not None:
+        from .profiling import SamplingProfiler
+        mixer.profiler = SamplingProfiler(interval=mixer.profiler.interval)
+        mixer.profiler.start()
+
+def _fit_fof_worker(fofindex):
+    """
+    fit the FoF at fofindex in a worker process
+
+    returns copies of the data and epoch data rows for the FoF, the
+    number of fits, the time spent fitting and the profile counts since
+    the last FoF if a sampling profile is being made
+    """
+    mixer = _WORKER_MIXER
+    mixer.curr_fofindex = fofindex
+    coadd_mb_obs_lists,mb_obs_lists = mixer.imageio.get_fof(fofindex)
+    tm = time.time()
+    num = mixer.fit_fof(coadd_mb_obs_lists,mb_obs_lists)
+    tm = time.time()-tm
+
+    fof_data = mixer.data.get_pending().copy()
+    fof_epoch_data = mixer.epoch_data.get_pending().copy()
+    mixer.data.rollback()
+    mixer.epoch_data.rollback()
+
+    if mixer.profiler is not None:
+        prof_counts = mixer.profiler.pop_counts()
+    else:
+        prof_counts = None
+
+    return fof_data,fof_epoch_data,num,tm,prof_counts
 
 class NGMixer(dict):
     def __init__(self,
@@ -26,8 +78,10 @@ class NGMixer(dict):
                  random_seed=None,
                  init_only=False,
                  profile=False,
+                 sample_profile=False,
                  make_plots=False,
                  verbosity=0,
+                 nworkers=None,
                  config=None):
 
         # parameters
@@ -42,10 +96,21 @@ class NGMixer(dict):
         self['fit_me_galaxy'] = self.get('fit_me_galaxy',True)
         self['max_box_size']=self.get('max_box_size',2048)
         self['verbosity'] = verbosity
+        if nworkers is not None:
+            self['nworkers'] = nworkers
+        else:
+            self['nworkers'] = self.get('nworkers',1)
         self.profile = profile
+        self.sample_profile = sample_profile
+        self.profiler = None
 
         # random numbers
+        # each FoF gets its own stream derived from this seed, so the
+        # results do not depend on which process fits the FoF
         seed_numpy(random_seed)
+        if random_seed is None:
+            random_seed = numpy.random.randint(0,2**30)
+        self['random_seed'] = random_seed
 
         self._set_defaults()
         self._set_imageio(data_files, fof_range, fof_file, extra_data)
@@ -66,6 +131,8 @@ class NGMixer(dict):
         if not init_only:
             if self.profile:
                 self.go_profile()
+            elif self.sample_profile:
+                self.go_sample_profile()
             else:
                 self.go()
 
@@ -87,6 +154,38 @@ class NGMixer(dict):
         p = pstats.Stats('profile_stats')
         p.sort_stats('time').print_stats()
 
+    def go_sample_profile(self):
+        """
+        run with the sampling profiler, which has a much lower overhead
+        than cProfile
+
+        the stack counts are written in folded format to
+        {output}-profile.txt
+        """
+        from .profiling import SamplingProfiler
+
+        print("doing sampling profile")
+
+        self.profiler = SamplingProfiler()
+        self.profiler.start()
+        try:
+            self.go()
+        finally:
+            self.profiler.stop()
+
+        profile_file = self.get_profile_file()
+        if profile_file is not None:
+            print('writing profile: %s' % profile_file)
+            self.profiler.write(profile_file)
+
+    def get_profile_file(self):
+        """
+        name of the sampling profile written next to the output
+        """
+        if self.output_file is None:
+            return None
+        return self.output_file.replace('.fits','-profile.txt')
+
 
     def _set_defaults(self):
         if self['verbosity'] > 0:
@@ -132,10 +231,20 @@ class NGMixer(dict):
         set_priors(self)
 
     def get_data(self):
-        return numpy.array(self.data,dtype=self.data_dtype)
+        return self.data.get_data()
 
     def get_epoch_data(self):
-        return numpy.array(self.epoch_data,dtype=self.epoch_data_dtype)
+        return self.epoch_data.get_data()
+
+    def get_timing_summary(self):
+        """
+        time spent in each stage, for the FoFs in the output and for
+        checkpointing and writing in this run
+        """
+        extra = {}
+        if hasattr(self,'fit_time'):
+            extra['fit_wall'] = self.fit_time
+        return TIMER.get_summary(data=self.get_data(),extra=extra)
 
     def get_file_meta_data(self):
         return self.imageio.get_file_meta_data()
@@ -151,48 +260,139 @@ class NGMixer(dict):
 
         t0=time.time()
         num = 0
+        numfof = 0
         numtot = self.imageio.get_num_fofs()
 
         print('fof index: %d:%d' % (self.curr_fofindex+1-self.start_fofindex,numtot))
-        for coadd_mb_obs_lists,mb_obs_lists in self.imageio:
-            foflen = len(mb_obs_lists)
-
-            # get data to fill
-            self.curr_data = self._make_struct(num=foflen)
-            for tag in self.default_data.dtype.names:
-                self.curr_data[tag][:] = self.default_data[tag]
-            self.curr_data_index = 0
-
-            # fit the fof
-            for coadd_mb_obs_list,mb_obs_list in zip(coadd_mb_obs_lists,mb_obs_lists):
-                if foflen > 1:
-                    print('fof obj: %d:%d' % (num,foflen))
-                print('    id: %d' % mb_obs_list.meta['id'])
-
-                num += 1
-                ti = time.time()
-                self.fit_obj(coadd_mb_obs_list,mb_obs_list)
-                ti = time.time()-ti
-                print('    time: %f' % ti)
-
-                self.curr_data_index += 1
-
-            # append data and incr.
-            self.data.extend(list(self.curr_data))
+        for fof_num,fof_time in self._fit_fofs():
+            numfof += 1
+            num += fof_num
+
+            # keep data and incr.
+            self.data.commit()
+            self.epoch_data.commit()
             self.curr_fofindex += 1
 
             tm=time.time()-t0
-            self._try_checkpoint(tm)
+            self._try_checkpoint(tm,fof_time)
 
             if self.curr_fofindex-self.start_fofindex < numtot:
                 print('fof index: %d:%d' % (self.curr_fofindex+1-self.start_fofindex,numtot))
 
         tm=time.time()-t0
         print("time: %f" % tm)
-        print("time per: %f" % (tm/num))
+        print("time per fit: %f" % (tm/num))
+        print("time per fof: %f" % (tm/numfof))
+        self.fit_time = tm
+        if self.ncheckpoint > 0:
+            print("checkpoints: %d time: %f" % (self.ncheckpoint,self.checkpoint_time))
 
         self.done = True
 
+    def _fit_fofs(self):
+        """
+        fit each FoF in order, yielding the number of fits and the time
+        spent fitting
+
+        the rows of each FoF are left pending in self.data and
+        self.epoch_data
+        """
+        if self['nworkers'] > 1:
+            for res in self._fit_fofs_pool():
+                yield res
+        else:
+            for coadd_mb_obs_lists,mb_obs_lists in self.imageio:
+                tm = time.time()
+                num = self.fit_fof(coadd_mb_obs_lists,mb_obs_lists)
+                yield num,time.time()-tm
+
+    def _fit_fofs_pool(self):
+        """
+        hand whole FoFs to a pool of worker processes
+
+        imap returns the results in the order of the FoFs, so the output
+        is the same as for a serial run
+        """
+        import multiprocessing
+
+        print('fitting with %d workers' % self['nworkers'])
+
+        fofindexes = xrange(self.curr_fofindex,
+                            self.curr_fofindex+self.imageio.get_num_fofs())
+
+        pool = multiprocessing.Pool(processes=self['nworkers'],
+                                    initializer=_init_fof_worker,
+                                    initargs=(self,))
+        try:
+            for fof_data,fof_epoch_data,num,tm,prof_counts in pool.imap(_fit_fof_worker,fofindexes):
+                self.data.extend(fof_data)
+                self.epoch_data.extend(fof_epoch_data)
+                if prof_counts is not None:
+                    self.profiler.add_counts(prof_counts)
+                yield num,tm
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def _setup_worker(self):
+        """
+        each worker owns its own files, priors and fitter
+        """
+        self.imageio.reopen()
+        self._set_priors()
+        self._set_fitter_and_data()
+
+    def _seed_fof(self,mb_obs_lists):
+        """
+        set up the random numbers for this FoF from the run seed and the
+        id of the first object in the FoF
+
+        self.rng is passed to the fitters; the global numpy state is seeded
+        from it as well for code in ngmix that draws from numpy.random
+        """
+        self.rng = get_fof_rng(self['random_seed'],mb_obs_lists[0].meta['id'])
+        seed_numpy(self.rng.randint(0,2**30))
+
+    def fit_fof(self,coadd_mb_obs_lists,mb_obs_lists):
+        """
+        fit all objects in a FoF
+
+        the rows for the FoF are written in place as pending rows of
+        self.data and self.epoch_data
+
+        returns the number of fits done
+        """
+        foflen = len(mb_obs_lists)
+
+        self._seed_fof(mb_obs_lists)
+
+        # get data to fill
+        self.curr_data = self.data.append(foflen)
+        self.curr_data[:] = self._make_struct()
+        for tag in self.default_data.dtype.names:
+            self.curr_data[tag][:] = self.default_data[tag]
+        self.curr_data_index = 0
+
+        # fit the fof
+        num = 0
+        for coadd_mb_obs_list,mb_obs_list in zip(coadd_mb_obs_lists,mb_obs_lists):
+            if foflen > 1:
+                print('fof obj: %d:%d' % (self.curr_data_index+1,foflen))
+            print('    id: %d' % mb_obs_list.meta['id'])
+
+            num += 1
+            ti = time.time()
+            self.fit_obj(coadd_mb_obs_list,mb_obs_list)
+            ti = time.time()-ti
+            print('    time: %f' % ti)
+
+            self.curr_data_index += 1
+
+        return num
+
     def _check_basic_things(self, coadd_mb_obs_list, mb_obs_list):
         
         # get the box size
@@ -279,6 +479,7 @@ class NGMixer(dict):
         """
 
         t0 = time.time()
+        TIMER.reset_object()
         
         #check flags
         flags = self._check_basic_things(coadd_mb_obs_list,mb_obs_list)
@@ -291,18 +492,31 @@ class NGMixer(dict):
         self.curr_data['flags'][self.curr_data_index] = flags
         self.curr_data['time_last_fit'][self.curr_data_index] = time.time()-t0
         self.curr_data['obj_flags'][self.curr_data_index] = mb_obs_list.meta['obj_flags']
+        self._fill_timing_data(mb_obs_list)
 
         # fill in from mb_obs_meta
         for tag in mb_obs_list.meta['meta_data'].dtype.names:
             self.curr_data[tag][self.curr_data_index] = mb_obs_list.meta['meta_data'][tag][0]
 
+    def _fill_timing_data(self,mb_obs_list):
+        """
+        add the time spent in each stage to the timing columns
+
+        MOF fits objects more than once, so the times are summed
+        """
+        ind = self.curr_data_index
+        self.curr_data['time_read'][ind] = mb_obs_list.meta.get('time_read',0.0)
+        for stage in OBJECT_STAGES:
+            if stage != 'read':
+                self.curr_data['time_%s' % stage][ind] += TIMER.get_object_time(stage)
+
     def _fill_epoch_data(self,mb_obs_list):
         # fill in epoch data
         for band,obs_list in enumerate(mb_obs_list):
             for obs in obs_list:
                 if 'fit_data' in obs.meta and obs.meta['fit_data'] is not None \
                    and 'meta_data' in obs.meta:
-                    ed = self._make_epoch_struct()
+                    ed = self.epoch_data.append()
                     for tag in self.default_epoch_data.dtype.names:
                         ed[tag] = self.default_epoch_data[tag]
 
@@ -312,8 +526,6 @@ class NGMixer(dict):
                     for tag in obs.meta['meta_data'].dtype.names:
                         ed[tag] = obs.meta['meta_data'][tag][0]
 
-                    self.epoch_data.extend(list(ed))
-
     def fit_all_obs_lists(self,coadd_mb_obs_list,mb_obs_list,nbrs_fit_data=None):
         """
         fit all obs lists
@@ -324,7 +536,8 @@ class NGMixer(dict):
         if self['fit_me_galaxy']:
             print('    fitting me galaxy')
             try:
-                me_fit_flags = self.fitter(mb_obs_list,coadd=False,nbrs_fit_data=nbrs_fit_data)
+                me_fit_flags = self.fitter(mb_obs_list,coadd=False,nbrs_fit_data=nbrs_fit_data,
+                                          rng=self.rng)
 
                 # fill in epoch data
                 self._fill_epoch_data(mb_obs_list)
@@ -344,7 +557,8 @@ class NGMixer(dict):
         if self['fit_coadd_galaxy']:
             print('    fitting coadd galaxy')
             try:
-                coadd_fit_flags = self.fitter(coadd_mb_obs_list,coadd=True,nbrs_fit_data=nbrs_fit_data)
+                coadd_fit_flags = self.fitter(coadd_mb_obs_list,coadd=True,nbrs_fit_data=nbrs_fit_data,
+                                             rng=self.rng)
 
                 # fill in epoch data
                 self._fill_epoch_data(coadd_mb_obs_list)
@@ -425,10 +639,10 @@ class NGMixer(dict):
         on the input checkpoint data
         """
         if self.checkpoint_data is None:
-            self.data = []
             self.data_dtype = self._get_dtype()
-            self.epoch_data = []
+            self.data = ResultStore(self.data_dtype)
             self.epoch_data_dtype = self._get_epoch_dtype()
+            self.epoch_data = ResultStore(self.epoch_data_dtype)
 
     def _get_epoch_dtype(self):
         """
@@ -452,6 +666,7 @@ class NGMixer(dict):
                ('time_last_fit','f8'),
                ('box_size','i2'),
                ('obj_flags','i4')]
+        dt += [('time_%s' % stage,'f8') for stage in OBJECT_STAGES]
         dt += self.fitter.get_fit_data_dtype(self['fit_me_galaxy'],self['fit_coadd_galaxy'])
         return dt
 
@@ -467,16 +682,69 @@ class NGMixer(dict):
         data['obj_flags'] = NO_ATTEMPT
         return data
 
+    def _make_default_struct(self):
+        """
+        make an output row with the defaults of a FoF that was not fit
+        """
+        data = self._make_struct()
+        for tag in self.default_data.dtype.names:
+            data[tag] = self.default_data[tag]
+        return data
+
+    def _make_default_epoch_struct(self):
+        """
+        make an epoch output row with the defaults of the fitter
+        """
+        epoch_data = self._make_epoch_struct()
+        for tag in self.default_epoch_data.dtype.names:
+            epoch_data[tag] = self.default_epoch_data[tag]
+        return epoch_data
+
     def _setup_checkpoints(self):
         """
-        Set up the checkpoint times in minutes and data
+        Set up the checkpoint policy and data
 
         self.checkpoint_data and self.checkpoint_file
+
+        A checkpoint is written after a FoF when any of these is true
+
+            checkpoint_every_nfof: N FoFs were fit since the last checkpoint
+            checkpoint_every_seconds: T seconds passed since the last checkpoint
+            checkpoint_fit_time_budget: the fit time since the last checkpoint,
+                summed over FoFs, exceeds this many seconds
+            checkpoints: the old list of run times in minutes, each used once
+
+        If none are set, checkpoint_every_seconds defaults to
+        _CHECKPOINT_DEFAULT_SECONDS.
         """
-        self.checkpoints = self.get('checkpoints',_CHECKPOINTS_DEFAULT_MINUTES)
+        self['checkpoint_every_nfof'] = self.get('checkpoint_every_nfof',None)
+        self['checkpoint_fit_time_budget'] = self.get('checkpoint_fit_time_budget',None)
+        self.checkpoints = self.get('checkpoints',[])
+
+        if (self['checkpoint_every_nfof'] is None
+                and self['checkpoint_fit_time_budget'] is None
+                and len(self.checkpoints) == 0):
+            every_seconds = _CHECKPOINT_DEFAULT_SECONDS
+        else:
+            every_seconds = None
+        self['checkpoint_every_seconds'] = self.get('checkpoint_every_seconds',every_seconds)
+
         self.n_checkpoint    = len(self.checkpoints)
         self.checkpointed    = [0]*self.n_checkpoint
 
+        # work done since the last checkpoint
+        self.nfof_unsaved = 0
+        self.fit_time_unsaved = 0.0
+        self.time_last_checkpoint = time.time()
+
+        # cost of checkpointing
+        self.ncheckpoint = 0
+        self.checkpoint_time = 0.0
+
+        # if True, only the rows fit since the last checkpoint are written
+        # to the existing checkpoint file
+        self['checkpoint_append'] = self.get('checkpoint_append',False)
+
         self._set_checkpoint_data()
 
         if self.checkpoint_file is not None:
@@ -489,9 +757,17 @@ class NGMixer(dict):
         See if checkpoint data was sent
         """
         import fitsio
-        import cPickle
 
         self.checkpoint_data = None
+        self.checkpoint_file = None
+
+        # number of rows of each table already in the checkpoint file
+        self.checkpoint_nrows = 0
+        self.checkpoint_nrows_epoch = 0
+
+        # older checkpoints have a different checkpoint_data table and
+        # are re-written in full the first time
+        self.checkpoint_can_append = False
 
         if self.output_file is not None:
             self.checkpoint_file = self.output_file.replace('.fits','-checkpoint.fits')
@@ -499,13 +775,29 @@ class NGMixer(dict):
                 self.checkpoint_data={}
                 print('reading checkpoint data: %s' % self.checkpoint_file)
                 with fitsio.FITS(self.checkpoint_file) as fobj:
-                    self.checkpoint_data['data'] = fobj['model_fits'][:]
-
-                    if 'epoch_data' in fobj:
-                        self.checkpoint_data['epoch_data']=fobj['epoch_data'][:]
-
-                    if 'checkpoint_data' in fobj:
-                        self.checkpoint_data['checkpoint_data'] = fobj['checkpoint_data'][:]
+                    cd = fobj['checkpoint_data'][:]
+                    self.checkpoint_data['checkpoint_data'] = cd
+
+                    # appended checkpoints can hold rows past the last
+                    # committed FoF if a run died while writing
+                    if 'nrows' in cd.dtype.names:
+                        nrows = cd['nrows'][0]
+                        nrows_epoch = cd['nrows_epoch'][0]
+                        self.checkpoint_can_append = True
+                    else:
+                        nrows = fobj['model_fits'].get_nrows()
+                        if 'epoch_data' in fobj:
+                            nrows_epoch = fobj['epoch_data'].get_nrows()
+                        else:
+                            nrows_epoch = 0
+
+                    self.checkpoint_data['data'] = fobj['model_fits'][0:nrows]
+
+                    if 'epoch_data' in fobj and nrows_epoch > 0:
+                        self.checkpoint_data['epoch_data']=fobj['epoch_data'][0:nrows_epoch]
+
+                self.checkpoint_nrows = nrows
+                self.checkpoint_nrows_epoch = nrows_epoch
 
         if self.checkpoint_data is not None:
             # data
@@ -514,50 +806,92 @@ class NGMixer(dict):
             self.data = self.data.byteswap().newbyteorder()
             self.data_dtype = self._get_dtype()
 
-            # for nband==1 the written array drops the arrayness
-            if self['nband']==1:
-                self.data.dtype = self.data_dtype
+            # checkpoints from older versions can have other columns; the
+            # rows are copied by name and the file is re-written in full
+            if set(self.data.dtype.names) != set(self.data_dtype.names):
+                print('checkpoint columns differ from this version, re-writing it')
+                self.checkpoint_can_append = False
 
-            self.data = list(self.data)
+            self.data = ResultStore(self.data_dtype,
+                                    data=copy_fields(self.data,self.data_dtype,
+                                                     default=self._make_default_struct()))
 
             # epoch data
             if 'epoch_data' in self.checkpoint_data:
                 self.epoch_data = self.checkpoint_data['epoch_data']
                 self.epoch_data = self.epoch_data.byteswap().newbyteorder()
                 self.epoch_data_dtype = self._get_epoch_dtype()
-                self.epoch_data = list(self.epoch_data)
+                if set(self.epoch_data.dtype.names) != set(self.epoch_data_dtype.names):
+                    self.checkpoint_can_append = False
+                self.epoch_data = ResultStore(self.epoch_data_dtype,
+                                              data=copy_fields(self.epoch_data,self.epoch_data_dtype,
+                                                               default=self._make_default_epoch_struct()))
             else:
                 self.epoch_data_dtype = self._get_epoch_dtype()
-                self.epoch_data = []
+                self.epoch_data = ResultStore(self.epoch_data_dtype)
 
             # checkpoint data
-            rs = cPickle.loads(self.checkpoint_data['checkpoint_data']['random_state'][0])
-            numpy.random.set_state(rs)
+            # the random state of older checkpoints is not needed since each
+            # FoF gets its own stream
+            cd = self.checkpoint_data['checkpoint_data']
+            if 'random_seed' in cd.dtype.names:
+                self['random_seed'] = cd['random_seed'][0]
             self.curr_fofindex = self.checkpoint_data['checkpoint_data']['curr_fofindex'][0]
             self.imageio.set_fof_start(self.curr_fofindex)
             self.start_fofindex = self.checkpoint_data['checkpoint_data']['curr_fofindex'][0]
 
-    def _try_checkpoint(self, tm):
+    def _try_checkpoint(self, tm, fof_time):
         """
-        Checkpoint at certain intervals.
+        Checkpoint if the policy says so, see _setup_checkpoints.
         Potentially modified self.checkpointed
         """
 
+        self.nfof_unsaved += 1
+        self.fit_time_unsaved += fof_time
+
         should_checkpoint, icheck = self._should_checkpoint(tm)
 
         if should_checkpoint:
-            self._write_checkpoint(tm)
-            self.checkpointed[icheck]=1
+            t0 = time.time()
+            with TIMER('checkpoint'):
+                self._write_checkpoint(tm)
+            t0 = time.time()-t0
+
+            if icheck >= 0:
+                self.checkpointed[icheck]=1
+
+            self.ncheckpoint += 1
+            self.checkpoint_time += t0
+            print('    checkpoint time: %f (%d fofs, %f s of fitting saved)' % \
+                      (t0,self.nfof_unsaved,self.fit_time_unsaved))
+
+            self.nfof_unsaved = 0
+            self.fit_time_unsaved = 0.0
+            self.time_last_checkpoint = time.time()
 
     def _should_checkpoint(self, tm):
         """
         Should we write a checkpoint file?
+
+        icheck is the index of the old style checkpoint that fired, or -1
         """
 
         should_checkpoint=False
         icheck=-1
 
         if self.do_checkpoint:
+            nfof = self['checkpoint_every_nfof']
+            if nfof is not None and self.nfof_unsaved >= nfof:
+                should_checkpoint=True
+
+            seconds = self['checkpoint_every_seconds']
+            if seconds is not None and time.time()-self.time_last_checkpoint >= seconds:
+                should_checkpoint=True
+
+            budget = self['checkpoint_fit_time_budget']
+            if budget is not None and self.fit_time_unsaved >= budget:
+                should_checkpoint=True
+
             tm_minutes=tm/60
 
             for i in xrange(self.n_checkpoint):
@@ -578,23 +912,64 @@ class NGMixer(dict):
         """
         import fitsio
         from .files import StagedOutFile
-        import cPickle
 
         print('checkpointing at %f minutes' % (tm/60))
         print(self.checkpoint_file)
 
         # make checkpoint data
-        cd = numpy.zeros(1,dtype=[('curr_fofindex','i8'),('random_state','|S16384')])
+        cd = numpy.zeros(1,dtype=[('curr_fofindex','i8'),
+                                  ('random_seed','i8'),
+                                  ('nrows','i8'),
+                                  ('nrows_epoch','i8')])
         cd['curr_fofindex'][0] = self.curr_fofindex
-        cd['random_state'][0] = cPickle.dumps(numpy.random.get_state())
+        cd['random_seed'][0] = self['random_seed']
+        cd['nrows'][0] = len(self.data)
+        cd['nrows_epoch'][0] = len(self.epoch_data)
+
+        if self['checkpoint_append'] and self.checkpoint_can_append:
+            self._append_checkpoint(cd)
+            return
 
         with StagedOutFile(self.checkpoint_file, tmpdir=self['work_dir']) as sf:
             with fitsio.FITS(sf.path,'rw',clobber=True) as fobj:
-                fobj.write(numpy.array(self.data,dtype=self.data_dtype), extname="model_fits")
+                fobj.write(self.get_data(), extname="model_fits")
                 if len(self.epoch_data) > 0:
-                    fobj.write(numpy.array(self.epoch_data,dtype=self.epoch_data_dtype), extname="epoch_data")
+                    fobj.write(self.get_epoch_data(), extname="epoch_data")
                 fobj.write(cd, extname="checkpoint_data")
 
+        self.checkpoint_nrows = cd['nrows'][0]
+        self.checkpoint_nrows_epoch = cd['nrows_epoch'][0]
+        self.checkpoint_can_append = True
+
+    def _append_checkpoint(self, cd):
+        """
+        write the rows fit since the last checkpoint to the end of the
+        tables in the checkpoint file, in place
+
+        The checkpoint_data row is written last.  If a run dies before it
+        is written, the extra rows are ignored on restart and over-written
+        by the next checkpoint.
+        """
+        import fitsio
+
+        data = self.get_data()[self.checkpoint_nrows:]
+        epoch_data = self.get_epoch_data()[self.checkpoint_nrows_epoch:]
+
+        with fitsio.FITS(self.checkpoint_file,'rw') as fobj:
+            if data.size > 0:
+                fobj['model_fits'].write(data, firstrow=self.checkpoint_nrows)
+
+            if epoch_data.size > 0:
+                if 'epoch_data' in fobj:
+                    fobj['epoch_data'].write(epoch_data, firstrow=self.checkpoint_nrows_epoch)
+                else:
+                    fobj.write(epoch_data, extname="epoch_data")
+
+            fobj['checkpoint_data'].write(cd, firstrow=0)
+
+        self.checkpoint_nrows = cd['nrows'][0]
+        self.checkpoint_nrows_epoch = cd['nrows_epoch'][0]
+
     def cleanup_checkpoint(self):
         """
         if we get this far, we have succeeded in writing the data. We can remove
@@ -616,12 +991,15 @@ class NGMixer(dict):
             with StagedOutFile(self.output_file, tmpdir=work_dir) as sf:
                 print('writing: %s' % sf.path)
                 with fitsio.FITS(sf.path,'rw',clobber=True) as fobj:
-                    fobj.write(self.get_data(),extname="model_fits")
+                    with TIMER('write'):
+                        fobj.write(self.get_data(),extname="model_fits")
+
+                        if self.epoch_data is not None:
+                            fobj.write(self.get_epoch_data(),extname="epoch_data")
 
-                    if self.epoch_data is not None:
-                        fobj.write(self.get_epoch_data(),extname="epoch_data")
+                        if self.meta is not None:
+                            fobj.write(self.meta,extname="meta_data")
 
-                    if self.meta is not None:
-                        fobj.write(self.meta,extname="meta_data")
+                    fobj.write(self.get_timing_summary(),extname="timing")
 
 
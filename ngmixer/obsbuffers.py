@@ -0,0 +1,71 @@
+"""
+share the pixel arrays of observations, copying them only when written to
+
+An epoch holds several versions of its image and weight map (weight_raw,
+weight_us, weight_orig, image_orig, ...) that are often the same pixels.
+Rather than copying them, the arrays are shared and marked read-only, so an
+in-place write to one of them raises instead of changing the others.  Code
+that modifies pixels in place gets a private copy first, with get_writable
+or update_pixels.
+
+Replacing an array with a new one, obs.weight = obs.weight_raw, is always
+safe and costs nothing.
+"""
+from __future__ import print_function
+import numpy
+
+def share(arr):
+    """
+    mark an array as shared, making it read-only, and return it
+    """
+    if arr is not None:
+        arr.flags.writeable = False
+    return arr
+
+def get_writable(obj, name):
+    """
+    get an array attribute of obj for writing in place
+
+    If the array is shared, the attribute is first replaced with a private
+    copy.
+    """
+    arr = getattr(obj, name)
+    if arr is not None and not arr.flags.writeable:
+        arr = arr.copy()
+        setattr(obj, name, arr)
+    return arr
+
+def update_pixels(obj, names, func):
+    """
+    modify the array attributes of obj in place with func(arr)
+
+    Attributes that are the same array are modified once and still share an
+    array afterwards.  Shared arrays are copied first.  Missing or None
+    attributes are skipped.
+
+        update_pixels(obs, ['weight','weight_raw'], lambda arr: numpy.multiply(arr,fac,arr))
+    """
+    done = {}
+    for name in names:
+        arr = getattr(obj, name, None)
+        if arr is None:
+            continue
+
+        key = id(arr)
+        if key not in done:
+            new_arr = arr
+            if not new_arr.flags.writeable:
+                new_arr = new_arr.copy()
+            func(new_arr)
+            done[key] = new_arr
+
+        if done[key] is not arr:
+            setattr(obj, name, done[key])
+
+def set_pixels(obj, names, index, value):
+    """
+    set arr[index] = value for the array attributes of obj, see update_pixels
+    """
+    def _set(arr):
+        arr[index] = value
+    update_pixels(obj, names, _set)
@@ -0,0 +1,121 @@
+"""
+low overhead sampling profiler
+
+The profiler samples the python stack on a timer and counts how often each
+stack is seen.  The counts are written in the "folded" format used by
+flame graph tools, one stack per line
+
+    ngmixit:<module>;ngmixing.py:go;ngmixing.py:do_fits;... 1234
+
+so the profiles of many runs can be merged by adding the counts.
+"""
+from __future__ import print_function
+import os
+import signal
+
+# seconds of cpu time between samples
+_DEFAULT_INTERVAL = 0.01
+
+class SamplingProfiler(object):
+    """
+    sample the stack of the main thread every interval seconds of cpu time
+
+        prof = SamplingProfiler()
+        prof.start()
+        ...
+        prof.stop()
+        prof.write('profile.txt')
+    """
+    def __init__(self, interval=_DEFAULT_INTERVAL):
+        self.interval = interval
+        self.counts = {}
+
+    def start(self):
+        signal.signal(signal.SIGPROF, self._sample)
+        # do not interrupt reads and writes when a sample is taken
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('%s:%s' % (os.path.basename(code.co_filename), code.co_name))
+            frame = frame.f_back
+
+        key = ';'.join(reversed(stack))
+        self.counts[key] = self.counts.get(key,0) + 1
+
+    def add_counts(self, counts):
+        """
+        add the counts from another profile, e.g. from a worker process
+        """
+        add_counts(self.counts, counts)
+
+    def pop_counts(self):
+        """
+        return the counts so far and start over
+        """
+        counts = self.counts
+        self.counts = {}
+        return counts
+
+    def write(self, fname):
+        """
+        write the counts in folded format
+        """
+        write_folded(fname, self.counts)
+
+def add_counts(counts, new_counts):
+    """
+    add new_counts into counts
+    """
+    for key,num in new_counts.iteritems():
+        counts[key] = counts.get(key,0) + num
+
+def read_folded(fname):
+    """
+    read counts in folded format
+    """
+    counts = {}
+    with open(fname,'r') as fp:
+        for line in fp:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            key,num = line.rsplit(' ',1)
+            counts[key] = counts.get(key,0) + int(num)
+    return counts
+
+def write_folded(fname, counts):
+    """
+    write counts in folded format, most common stacks first
+    """
+    keys = sorted(counts, key=lambda k: counts[k], reverse=True)
+    with open(fname,'w') as fp:
+        for key in keys:
+            fp.write('%s %d\n' % (key,counts[key]))
+
+def merge_folded(fnames, output_file=None):
+    """
+    add up the counts in a set of folded profiles
+
+    missing files are skipped.  The merged counts are written to
+    output_file if it is sent.
+    """
+    counts = {}
+    for fname in fnames:
+        if not os.path.exists(fname):
+            print("    skipping missing profile: %s" % fname)
+            continue
+        add_counts(counts, read_folded(fname))
+
+    if output_file is not None:
+        print("writing: %s" % output_file)
+        write_folded(output_file, counts)
+
+    return counts
@@ -0,0 +1,131 @@
+"""
+lightweight timers for the stages of a run
+"""
+from __future__ import print_function
+import time
+import numpy
+from contextlib import contextmanager
+
+# stages timed for each object, written as time_{stage} columns
+OBJECT_STAGES = ['read','psf','psf_flux','gal','metacal','nbrs']
+
+class StageTimer(object):
+    """
+    accumulate the wall time spent in named stages
+
+    Stages can be nested.  The time in a stage does not include the time
+    spent in the stages nested in it, so the times of all stages add up to
+    the total time spent in any stage.
+
+        with TIMER('psf'):
+            fit the psfs
+
+    Times are accumulated for the whole run (totals) and since the last
+    call to reset_object (object_times).  Each process has its own timer;
+    the read times of FoFs read in another process get to the output
+    through the time_read meta data of the objects.
+    """
+    def __init__(self):
+        self.totals = {}
+        self.object_times = {}
+        self._stack = []
+        self._tstart = None
+
+    def _add(self, stage, tm):
+        self.totals[stage] = self.totals.get(stage,0.0) + tm
+        self.object_times[stage] = self.object_times.get(stage,0.0) + tm
+
+    def start(self, stage):
+        """
+        start timing a stage, pausing the current one
+        """
+        now = time.time()
+        if len(self._stack) > 0:
+            self._add(self._stack[-1], now-self._tstart)
+        self._stack.append(stage)
+        self._tstart = now
+
+    def stop(self):
+        """
+        stop timing the current stage, resuming the one it was nested in
+        """
+        now = time.time()
+        stage = self._stack.pop()
+        self._add(stage, now-self._tstart)
+        self._tstart = now
+
+    @contextmanager
+    def __call__(self, stage):
+        self.start(stage)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def timed(self, stage):
+        """
+        decorator to time every call of a function or method as a stage
+        """
+        def decorator(func):
+            def wrapper(*args, **kwargs):
+                with self(stage):
+                    return func(*args, **kwargs)
+            wrapper.__name__ = func.__name__
+            wrapper.__doc__ = func.__doc__
+            return wrapper
+        return decorator
+
+    def reset_object(self):
+        """
+        start a new set of per-object times
+        """
+        self.object_times = {}
+
+    def get_object_time(self, stage):
+        """
+        time spent in the stage since the last reset_object
+        """
+        return self.object_times.get(stage,0.0)
+
+    def get_summary(self, data=None, extra=None):
+        """
+        get a summary table of the time spent in each stage
+
+        parameters
+        ----------
+        data: structured array, optional
+            The output rows.  If sent, the per-object stage times are summed
+            from the time_{stage} columns, which also holds the time spent in
+            worker processes.  Otherwise the totals of this timer are used.
+        extra: dict, optional
+            extra stage times to add to the table
+        """
+        stages = []
+        times = []
+
+        for stage in OBJECT_STAGES:
+            col = 'time_%s' % stage
+            if data is not None and col in data.dtype.names:
+                tm = data[col].sum()
+            else:
+                tm = self.totals.get(stage,0.0)
+            stages.append(stage)
+            times.append(tm)
+
+        for stage in sorted(self.totals):
+            if stage not in OBJECT_STAGES:
+                stages.append(stage)
+                times.append(self.totals[stage])
+
+        if extra is not None:
+            for stage in sorted(extra):
+                stages.append(stage)
+                times.append(extra[stage])
+
+        summary = numpy.zeros(len(stages), dtype=[('stage','S16'),('time','f8')])
+        summary['stage'] = stages
+        summary['time'] = times
+        return summary
+
+# one timer per process
+TIMER = StageTimer()
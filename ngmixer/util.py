@@ -36,10 +36,25 @@ def thetaphi_to_unitvecs_ruv(theta,phi):
 
     rhat = numpy.array([sint*cosp,sint*sinp,cost])
     that = numpy.array([cost*cosp,cost*sinp,-1.0*sint])
-    phat = numpy.array([-1.0*sinp,cosp,0.0])
+    phat = numpy.array([-1.0*sinp,cosp,numpy.zeros_like(sinp)])
 
     return rhat,phat,-1.0*that
 
+def get_tangent_plane_offsets(ra_cen,dec_cen,ra,dec):
+    """
+    u,v offsets in arcsec of ra,dec from ra_cen,dec_cen, works for arrays
+
+    The offset is the vector to the point where rhat of ra,dec hits the
+    tangent plane at ra_cen,dec_cen, which differs in length from unity by
+    1/cos(angle between them).
+    """
+    rhat_cen,uhat_cen,vhat_cen = radec_to_unitvecs_ruv(ra_cen,dec_cen)
+    rhat,uhat,vhat = radec_to_unitvecs_ruv(ra,dec)
+    cosang = (rhat_cen*rhat).sum(axis=0)
+    u = (rhat*uhat_cen).sum(axis=0)/cosang/numpy.pi*180.0*60.0*60.0 # arcsec
+    v = (rhat*vhat_cen).sum(axis=0)/cosang/numpy.pi*180.0*60.0*60.0 # arcsec
+    return u,v
+
 
 def interpolate_image(rowcen1, colcen1, jacob1, im1, 
                       rowcen2, colcen2, jacob2):
@@ -380,4 +395,122 @@ def seed_numpy(random_seed):
     if random_seed is not None:
         numpy.random.seed(random_seed)
 
+def get_fof_rng(random_seed, fof_key):
+    """
+    get a random number generator for a single FoF
+
+    The generator depends only on the run seed and a key identifying the
+    FoF (e.g. the id of its first member), so that a FoF gets the same
+    random numbers no matter which process fits it or in what order.
+    """
+    fof_key = int(fof_key)
+    seed = [int(random_seed) % 2**32, fof_key % 2**32, (fof_key // 2**32) % 2**32]
+    return numpy.random.RandomState(seed)
 
+def copy_fields(rows, dtype, default=None):
+    """
+    copy rows into a new array of dtype, field by field by name
+
+    Fields missing from rows get their value in the one row array default,
+    or zero if default is None or does not have them.  Fields not in dtype
+    are dropped.  Fields written without their length one array dimension,
+    as fitsio does for nband==1, are reshaped.
+    """
+    out = numpy.zeros(rows.size, dtype=dtype)
+    for name in out.dtype.names:
+        if name in rows.dtype.names:
+            out[name] = rows[name].reshape(out[name].shape)
+        elif default is not None and name in default.dtype.names:
+            out[name][:] = default[name]
+    return out
+
+class ResultStore(object):
+    """
+    growable structured array for output rows
+
+    Rows are added at the end with append, which returns a view of the new
+    rows to be filled in place.  These rows are pending until commit is
+    called and can be dropped with rollback.  The buffer doubles in size
+    when it is full, so adding N rows costs O(N) copies in total.
+
+        store = ResultStore(dtype)
+        rows = store.append(3)
+        rows['flags'] = 0
+        store.commit()
+        data = store.get_data()
+    """
+    def __init__(self, dtype, data=None, size=1024):
+        self.dtype = numpy.dtype(dtype)
+        self._data = numpy.zeros(max(size,1), dtype=self.dtype)
+        self._size = 0
+        self._npending = 0
+
+        if data is not None:
+            self.extend(data)
+            self.commit()
+
+    def __len__(self):
+        """
+        number of committed rows
+        """
+        return self._size
+
+    def _reserve(self, num):
+        """
+        make room for num more rows
+        """
+        nused = self._size + self._npending
+        nneed = nused + num
+        if nneed > self._data.size:
+            nnew = self._data.size
+            while nnew < nneed:
+                nnew *= 2
+            data = numpy.zeros(nnew, dtype=self.dtype)
+            data[0:nused] = self._data[0:nused]
+            self._data = data
+
+    def append(self, num=1):
+        """
+        add num zeroed rows and return a view of them
+
+        the view is only valid until the next call to append or extend
+        """
+        self._reserve(num)
+        start = self._size + self._npending
+        self._npending += num
+        return self._data[start:start+num]
+
+    def extend(self, rows):
+        """
+        add a copy of the rows as pending rows
+        """
+        rows = numpy.asarray(rows)
+        if rows.size > 0:
+            self.append(rows.size)[:] = rows
+
+    def get_pending(self):
+        """
+        view of the rows that have not been committed
+        """
+        return self._data[self._size:self._size+self._npending]
+
+    def commit(self):
+        """
+        keep all pending rows
+        """
+        self._size += self._npending
+        self._npending = 0
+
+    def rollback(self):
+        """
+        drop all pending rows
+        """
+        if self._npending > 0:
+            self.get_pending()[:] = numpy.zeros(1, dtype=self.dtype)
+        self._npending = 0
+
+    def get_data(self):
+        """
+        view of the committed rows
+        """
+        return self._data[0:self._size]